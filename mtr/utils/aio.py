@@ -0,0 +1,82 @@
+import asyncio
+import functools
+
+from timeit import default_timer
+from collections import OrderedDict
+
+from .manager import DispatchError, LazyHandler
+from .memoize import Memoized
+
+
+async def call_handler(func, args=(), kwargs=None, executor=None, loop=None):
+    """Await coroutine handler or run sync handler in executor"""
+
+    kwargs = kwargs or {}
+
+    target = func.func if isinstance(func, Memoized) else func
+    if isinstance(target, LazyHandler):
+        target = target.resolve()
+
+    if asyncio.iscoroutinefunction(target):
+        if isinstance(func, Memoized):
+            raise ValueError('coroutine handler {} can not be cached'.format(
+                getattr(target, '__name__', target)))
+        return await target(*args, **kwargs)
+
+    loop = loop or asyncio.get_event_loop()
+    return await loop.run_in_executor(
+        executor, functools.partial(func, *args, **kwargs))
+
+
+async def call_all(
+        manager, type_name, args=(), kwargs=None, related=None,
+        concurrency=None, timeout=None, loop=None):
+    """Gather all handlers of type with bounded concurrency and return
+    ordered dict of results, raises DispatchError if any failed"""
+
+    loop = loop or asyncio.get_event_loop()
+    executor = manager._get_executor()
+    semaphore = asyncio.Semaphore(concurrency) if concurrency else None
+
+    async def timed(name, call):
+        metrics = manager._metrics
+        if metrics is None:
+            return await call
+
+        start = default_timer()
+        try:
+            result = await call
+        except Exception:
+            metrics.record(
+                (type_name, related, name), default_timer() - start, True)
+            raise
+        metrics.record((type_name, related, name), default_timer() - start)
+        return result
+
+    async def run(name, func):
+        limit = timeout.get(name, None) \
+            if isinstance(timeout, dict) else timeout
+        call = asyncio.wait_for(call_handler(
+            func, args, kwargs, executor=executor, loop=loop), limit)
+
+        if semaphore is None:
+            return await timed(name, call)
+
+        async with semaphore:
+            return await timed(name, call)
+
+    items = manager.items(type_name, related=related)
+    outcomes = await asyncio.gather(
+        *[run(name, func) for name, func in items], return_exceptions=True)
+
+    results, errors = OrderedDict(), OrderedDict()
+    for (name, func), outcome in zip(items, outcomes):
+        if isinstance(outcome, Exception):
+            errors[name] = outcome
+        else:
+            results[name] = outcome
+
+    if errors:
+        raise DispatchError(errors, results)
+
+    return results
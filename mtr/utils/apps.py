@@ -8,3 +8,21 @@ class MtrUtilsConfig(AppConfig):
     name = 'mtr.utils'
     label = 'mtr_utils'
     verbose_name = _('Utilities')
+
+    def ready(self):
+        from django.db.models.signals import class_prepared, \
+            post_save, post_delete
+        from django.test.signals import setting_changed
+
+        from .helpers import clear_models_cache, models_list, \
+            clear_themed_templates, warm_themed_templates
+        from .models.mixins import expire_published
+
+        class_prepared.connect(clear_models_cache)
+        setting_changed.connect(clear_models_cache)
+        setting_changed.connect(clear_themed_templates)
+        post_save.connect(expire_published)
+        post_delete.connect(expire_published)
+
+        models_list()
+        warm_themed_templates()
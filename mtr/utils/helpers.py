@@ -1,20 +1,40 @@
 import os
-import types
-import collections
+import hashlib
+import multiprocessing
 
+from datetime import date
 from functools import wraps
+from itertools import islice, chain
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, \
+    as_completed
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
 import django
 
-from django.db import models
+from django.db import models, transaction
 from django.conf import settings
-from django.utils.encoding import smart_text
+from django.core.cache import caches
+from django.utils.cache import has_vary_header
+from django.utils import six, timezone
+from django.utils.encoding import smart_text, force_text
+from django.utils.translation import get_language
+from django.http import HttpResponse, StreamingHttpResponse
 from django.shortcuts import render
+from django.template.base import TextNode, VariableDoesNotExist
+from django.template.defaulttags import ForNode
+from django.template.context import make_context
+from django.template.loader import get_template, select_template
+from django.template.loader_tags import ExtendsNode, BlockNode, \
+    BlockContext, BLOCK_CONTEXT_KEY
 from django.utils.six.moves import filterfalse, range
 from django.utils.six.moves.urllib.parse import urljoin
 from django.core.exceptions import PermissionDenied
 
-from .settings import THEMES, DOMAIN_URL
+from .settings import SETTINGS, THEMES, DOMAIN_URL
 
 # TODO: separate to smaller libs
 
@@ -33,34 +53,390 @@ def themed_path(
     return os.path.join(path, template)
 
 
+STREAM_CHUNK_SIZE = 8192
+
+RENDER_THEMED_KWARGS = ('content_type', 'status', 'using')
+
+_themed_templates = {}
+
+
+def themed_templates(template, version_subdirectory=None):
+    """Return fallback chain of template paths: theme with django version
+    subdirectory, theme, default theme and original template"""
+
+    if version_subdirectory is None:
+        version_subdirectory = THEMES.get('version_subdirectory', False)
+
+    chain = []
+    if version_subdirectory:
+        chain.append(themed_path(template, version_subdirectory=True))
+    chain.append(themed_path(template))
+    if THEMES.get('fallback_to_default', True):
+        chain.append(themed_path(
+            template, theme=THEMES.get('default_theme', 'default')))
+    chain.append(template)
+
+    return [path for i, path in enumerate(chain) if path not in chain[:i]]
+
+
+def resolve_themed_template(template, using=None):
+    """Return first existing template from theme fallback chain,
+    resolved template is cached per process"""
+
+    key = (template, using)
+    resolved = _themed_templates.get(key, None)
+    if resolved is None:
+        resolved = select_template(themed_templates(template), using=using)
+        if THEMES.get('cache', True):
+            _themed_templates[key] = resolved
+    return resolved
+
+
+def warm_themed_templates(templates=None, using=None):
+    """Resolve and cache themed templates before first request"""
+
+    for template in templates or THEMES.get('preload', ()):
+        resolve_themed_template(template, using=using)
+
+
+def clear_themed_templates(**kwargs):
+    _themed_templates.clear()
+
+
+def render_themed(
+        request, template, context=None,
+        content_type=None, status=None, using=None):
+    """Render themed template to response without checking file system
+    when template already resolved"""
+
+    content = resolve_themed_template(template, using=using) \
+        .render(context, request)
+    return HttpResponse(content, content_type, status)
+
+
+def _iter_nodes(nodelist, context):
+    for node in nodelist:
+        if isinstance(node, ExtendsNode):
+            iterator = _iter_extends(node, context)
+        elif isinstance(node, BlockNode):
+            iterator = _iter_block(node, context)
+        elif isinstance(node, ForNode):
+            iterator = _iter_for(node, context)
+        else:
+            render = getattr(node, 'render_annotated', node.render)
+            iterator = (render(context),)
+
+        for bit in iterator:
+            yield force_text(bit)
+
+
+def _iter_block(node, context):
+    """Same as BlockNode.render, but yields nodes one by one"""
+
+    block_context = context.render_context.get(BLOCK_CONTEXT_KEY)
+    with context.push():
+        if block_context is None:
+            context['block'] = node
+            for bit in _iter_nodes(node.nodelist, context):
+                yield bit
+        else:
+            push = block = block_context.pop(node.name)
+            if block is None:
+                block = node
+            block = type(node)(block.name, block.nodelist)
+            block.context = context
+            context['block'] = block
+            try:
+                for bit in _iter_nodes(block.nodelist, context):
+                    yield bit
+            finally:
+                if push is not None:
+                    block_context.push(node.name, push)
+
+
+def _iter_for(node, context):
+    """Same as ForNode.render, but yields nodes of every loop one by one"""
+
+    parentloop = context['forloop'] if 'forloop' in context else {}
+
+    with context.push():
+        try:
+            values = node.sequence.resolve(context, True)
+        except VariableDoesNotExist:
+            values = []
+        if values is None:
+            values = []
+        if not hasattr(values, '__len__'):
+            values = list(values)
+
+        length = len(values)
+        if not length:
+            for bit in _iter_nodes(node.nodelist_empty, context):
+                yield bit
+            return
+
+        if node.is_reversed:
+            values = reversed(values)
+
+        loop = context['forloop'] = {'parentloop': parentloop}
+        for index, item in enumerate(values):
+            loop.update({
+                'counter0': index, 'counter': index + 1,
+                'revcounter': length - index,
+                'revcounter0': length - index - 1,
+                'first': index == 0, 'last': index == length - 1,
+            })
+
+            if len(node.loopvars) > 1:
+                context.update(dict(zip(node.loopvars, item)))
+            else:
+                context[node.loopvars[0]] = item
+
+            for bit in _iter_nodes(node.nodelist_loop, context):
+                yield bit
+
+            if len(node.loopvars) > 1:
+                context.pop()
+
+
+def _iter_extends(node, context):
+    """Same as ExtendsNode.render, but yields parent nodes one by one"""
+
+    parent = node.get_parent(context)
+
+    if BLOCK_CONTEXT_KEY not in context.render_context:
+        context.render_context[BLOCK_CONTEXT_KEY] = BlockContext()
+    block_context = context.render_context[BLOCK_CONTEXT_KEY]
+    block_context.add_blocks(node.blocks)
+
+    for parent_node in parent.nodelist:
+        if not isinstance(parent_node, TextNode):
+            if not isinstance(parent_node, ExtendsNode):
+                block_context.add_blocks(dict(
+                    (n.name, n) for n in
+                    parent.nodelist.get_nodes_by_type(BlockNode)))
+            break
+
+    # django 1.11 isolates render context state per template
+    push_state = getattr(context.render_context, 'push_state', None)
+    if push_state is None:
+        for bit in _iter_nodes(parent.nodelist, context):
+            yield bit
+    else:
+        with push_state(parent, isolated_context=False):
+            for bit in _iter_nodes(parent.nodelist, context):
+                yield bit
+
+
+def stream_template(
+        template, context=None, request=None, chunk_size=STREAM_CHUNK_SIZE):
+    """Render template node by node, including nodes of extended
+    templates, yields chunks of at least chunk_size characters"""
+
+    engine_template = getattr(template, 'template', None)
+    if engine_template is None:
+        # not django engine, render at once
+        yield template.render(context, request)
+        return
+
+    context = make_context(context, request)
+    push_state = getattr(context.render_context, 'push_state', None)
+    state = push_state(engine_template) if push_state is not None \
+        else context.render_context.push()
+
+    buffer, size = [], 0
+    with state, context.bind_template(engine_template):
+        context.template = engine_template
+        for bit in _iter_nodes(engine_template.nodelist, context):
+            buffer.append(bit)
+            size += len(bit)
+            if size >= chunk_size:
+                yield ''.join(buffer)
+                buffer, size = [], 0
+
+    if buffer:
+        yield ''.join(buffer)
+
+
+def stream_themed(
+        request, template, context=None, content_type=None, status=None,
+        using=None, themed=True, chunk_size=STREAM_CHUNK_SIZE):
+    """Render template to streaming response"""
+
+    if themed:
+        template = resolve_themed_template(template, using=using)
+    else:
+        template = get_template(template, using=using)
+
+    response = StreamingHttpResponse(
+        stream_template(template, context, request, chunk_size),
+        content_type, status)
+    return response
+
+
+def _render_cache_options(cache):
+    options = dict(SETTINGS['render_cache'])
+    if isinstance(cache, dict):
+        options.update(cache)
+    elif cache is not True:
+        options['timeout'] = cache
+    return options
+
+
+def _render_cache_version_key(template, prefix):
+    return '{}:version:{}'.format(prefix, template)
+
+
+def render_cache_version(template, alias=None):
+    """Current cache version of pages rendered with template"""
+
+    options = SETTINGS['render_cache']
+    cache = caches[alias or options['alias']]
+    key = _render_cache_version_key(template, options['prefix'])
+
+    version = cache.get(key, None)
+    if version is None:
+        version = 1
+        cache.add(key, version, None)
+    return version
+
+
+def invalidate_render_cache(template, alias=None):
+    """Expire all cached pages rendered with template"""
+
+    options = SETTINGS['render_cache']
+    cache = caches[alias or options['alias']]
+    key = _render_cache_version_key(template, options['prefix'])
+
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)
+
+
+def _render_cache_vary(request, name):
+    if name == 'language':
+        return get_language()
+    elif name == 'groups':
+        user = getattr(request, 'user', None)
+        if user is None:
+            return ()
+        return tuple(sorted(user_group_names(user)))
+    return request.META.get(name, None)
+
+
+def _render_cacheable(request, options):
+    if request.method not in ('GET', 'HEAD'):
+        return False
+
+    user = getattr(request, 'user', None)
+    return not options['anonymous_only'] or \
+        user is None or not user.is_authenticated()
+
+
+def _render_response_cacheable(request, response):
+    """Responses with csrf token, cookies or used messages are personal,
+    session and messages middlewares run after view, so their cookies
+    and headers are not visible here"""
+
+    messages = getattr(request, '_messages', None)
+    if getattr(messages, 'used', False) or \
+            getattr(messages, 'added_new', False):
+        return False
+
+    return response.status_code == 200 and not response.streaming and \
+        not request.META.get('CSRF_COOKIE_USED', False) and \
+        not response.cookies and not has_vary_header(response, 'Cookie')
+
+
+def render_cache_key(request, template, view, args, kwargs, options):
+    """Cache key of rendered page by template version,
+    view arguments, full path and vary inputs"""
+
+    key = repr((
+        template, THEMES['theme'], view.__module__, view.__name__, args,
+        sorted(kwargs.items()), request.get_full_path(),
+        [_render_cache_vary(request, name) for name in options['vary']]))
+
+    return '{}:{}:{}'.format(
+        options['prefix'],
+        render_cache_version(template, options['alias']),
+        hashlib.md5(key.encode('utf-8')).hexdigest())
+
+
 def render_to(template, *args, **kwargs):
     """Shortuct for rendering templates,
     creates functions that returns decorator for view"""
 
     decorator_kwargs = kwargs
+    themed = decorator_kwargs.pop('themed', THEMES['use_in_render'])
+    stream = decorator_kwargs.pop('stream', False)
+    chunk_size = decorator_kwargs.pop('chunk_size', STREAM_CHUNK_SIZE)
+    cache = decorator_kwargs.pop('cache', None)
+    if cache is not None:
+        cache = _render_cache_options(cache)
 
-    # TODO: add check if file exist if not try use base theme
-    # if base not found use fall back, then raise error with original
-    # template provided in function
+    # dirs, current_app, context_instance and other render arguments
+    # can not be honoured with resolved template, use plain render
+    plain = bool(set(decorator_kwargs).difference(RENDER_THEMED_KWARGS))
 
     # outer decorator
     def decorator(f):
 
-        # inner decorator
-        @wraps(f)
-        def wrapper(request, *args, **kwargs):
+        def render_response(request, *args, **kwargs):
             response = f(request, *args, **kwargs)
             if isinstance(response, dict):
-                new_template = template
-                if decorator_kwargs.pop(
-                        'themed', THEMES['use_in_render']):
-                    new_template = themed_path(template)
+                if plain:
+                    return render(
+                        request,
+                        themed_templates(template) if themed else template,
+                        response, **decorator_kwargs)
+
+                if stream:
+                    return stream_themed(
+                        request, template, response, themed=themed,
+                        chunk_size=chunk_size, **decorator_kwargs)
+
+                if themed:
+                    return render_themed(
+                        request, template, response, **decorator_kwargs)
 
                 return render(
-                    request, new_template,
+                    request, template,
                     response, **decorator_kwargs)
             else:
                 return response
+
+        # inner decorator
+        @wraps(f)
+        def wrapper(request, *args, **kwargs):
+            if cache is None or not _render_cacheable(request, cache):
+                return render_response(request, *args, **kwargs)
+
+            backend = caches[cache['alias']]
+            key = render_cache_key(
+                request, template, f, args, kwargs, cache)
+
+            response = backend.get(key, None)
+            if response is None:
+                # session could be accessed before by auth, track only
+                # access by view and templates
+                session = getattr(request, 'session', None)
+                accessed = getattr(session, 'accessed', False)
+                if session is not None:
+                    session.accessed = False
+
+                try:
+                    response = render_response(request, *args, **kwargs)
+                finally:
+                    personal = getattr(session, 'accessed', False)
+                    if session is not None:
+                        session.accessed = accessed or personal
+
+                if not personal and \
+                        _render_response_cacheable(request, response):
+                    backend.set(key, response, cache['timeout'])
+            return response
         return wrapper
 
     return decorator
@@ -88,25 +464,193 @@ def make_prefixed_render_to(prefix):
 
 
 def chunks(l, n, as_list=False):
-    """Chunk list by n slices and return iterator or list"""
+    """Chunk list, queryset or any iterable by n items lazily
+    and return iterator or list"""
 
-    n = max(1, n)
-    iterator = [l[i:i + n] for i in range(0, len(l), n)]
+    n = max(1, int(n))
+
+    if isinstance(l, models.QuerySet):
+        iterator = queryset_chunks(l, n)
+    elif hasattr(l, '__getitem__') and hasattr(l, '__len__'):
+        iterator = (l[i:i + n] for i in range(0, len(l), n))
+    else:
+        iterator = iterable_chunks(l, n)
     return list(iterator) if as_list else iterator
 
 
+def iterable_chunks(iterable, n):
+    """Yield lists of n items from iterable with constant memory"""
+
+    iterator = iter(iterable)
+    chunk = list(islice(iterator, n))
+    while chunk:
+        yield chunk
+        chunk = list(islice(iterator, n))
+
+
+def queryset_chunks(queryset, n):
+    """Yield lists of n instances, unordered or ordered by pk querysets
+    are fetched by pk > last pk instead of offset, others are streamed
+    with single query keeping their ordering"""
+
+    query = queryset.query
+    ordering = tuple(query.order_by) or (
+        tuple(queryset.model._meta.ordering)
+        if query.default_ordering else ())
+
+    if ordering not in ((), ('pk',), (queryset.model._meta.pk.name,)) or \
+            getattr(queryset, '_fields', None) is not None or \
+            query.low_mark or query.high_mark is not None:
+        for chunk in iterable_chunks(queryset.iterator(), n):
+            yield chunk
+        return
+
+    queryset = queryset.order_by('pk')
+    page = queryset
+    while True:
+        chunk = list(page[:n].iterator())
+        if chunk:
+            yield chunk
+        if len(chunk) < n:
+            break
+        page = queryset.filter(pk__gt=chunk[-1].pk)
+
+
+def queryset_partitions(queryset, parts):
+    """Split queryset into querysets by primary key ranges"""
+
+    parts = max(1, int(parts))
+    pk = queryset.model._meta.pk
+
+    if isinstance(pk, (models.AutoField, models.IntegerField)):
+        bounds = queryset.order_by().aggregate(
+            low=models.Min('pk'), high=models.Max('pk'))
+        low, high = bounds['low'], bounds['high']
+        if low is None:
+            return []
+
+        step = (high - low) // parts + 1
+        return [
+            queryset.filter(pk__gte=start, pk__lt=start + step)
+            for start in range(low, high + 1, step)]
+
+    count = queryset.order_by().count()
+    if not count:
+        return []
+
+    size = -(-count // parts)
+    pks = queryset.order_by('pk').values_list('pk', flat=True)
+    starts = [
+        chunk[0] for chunk in iterable_chunks(pks.iterator(), size)]
+    return [
+        queryset.filter(pk__gte=start, pk__lt=end)
+        if end is not None else queryset.filter(pk__gte=start)
+        for start, end in zip(starts, starts[1:] + [None])]
+
+
+def _map_partition(func, model, query, using):
+    from django.apps import apps
+    from django.db import connections
+
+    if not apps.ready:
+        django.setup()
+
+    queryset = model._base_manager.using(using).all()
+    queryset.query = query
+    try:
+        return func(queryset)
+    finally:
+        connections.close_all()
+
+
+def map_partitions(
+        queryset, func, parts=None, executor='process', max_workers=None,
+        ordered=True, progress=None):
+    """Map func over primary key partitions of queryset in process
+    or thread pool, every worker uses its own database connections,
+    progress is called with (done, total) after each partition"""
+
+    from django.db import connections
+
+    max_workers = max_workers or multiprocessing.cpu_count() or 1
+    partitions = queryset_partitions(queryset, parts or max_workers)
+    total = len(partitions)
+
+    own_executor = isinstance(executor, six.string_types)
+    if executor == 'process':
+        connections.close_all()
+        executor = ProcessPoolExecutor(max_workers=max_workers)
+    elif executor == 'thread':
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    try:
+        futures = [
+            executor.submit(
+                _map_partition, func, p.model, p.query, p.db)
+            for p in partitions]
+
+        results = [None] * total if ordered else []
+        positions = dict((f, i) for i, f in enumerate(futures))
+        for done, future in enumerate(as_completed(futures), 1):
+            if ordered:
+                results[positions[future]] = future.result()
+            else:
+                results.append(future.result())
+            if progress is not None:
+                progress(done, total)
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    return results
+
+
+MERGE = 'merge'
+REPLACE = 'replace'
+APPEND = 'append'
+
+
+def merge_dicts(d, u, strategy=MERGE, lists=REPLACE, inplace=True):
+    """Iterative deep merge of u into d, strategy MERGE updates nested
+    dicts by values and REPLACE overwrites them, lists are replaced or
+    extended with APPEND, not inplace merge returns new dict sharing
+    untouched subtrees of d and u instead of copying them"""
+
+    result = d if inplace else d.copy()
+    merge = strategy == MERGE
+    append = lists == APPEND
+    stack = [(result, u)]
+
+    while stack:
+        target, source = stack.pop()
+
+        for key, value in source.items():
+            if merge and (
+                    value.__class__ is dict or isinstance(value, Mapping)):
+                current = target.get(key, None)
+                if isinstance(current, dict):
+                    if not inplace:
+                        current = target[key] = current.copy()
+                    stack.append((current, value))
+                elif inplace:
+                    current = target[key] = \
+                        value.__class__() if isinstance(value, dict) else {}
+                    stack.append((current, value))
+                else:
+                    target[key] = value
+            elif append and isinstance(value, list) and \
+                    isinstance(target.get(key, None), list):
+                target[key] = target[key] + value
+            else:
+                target[key] = value
+
+    return result
+
+
 def update_nested_dict(d, u):
     """Simple function to update nested dict"""
 
-    # TODO: needs more tests in some cases updates all dict instead of values
-
-    for k, v in u.items():
-        if isinstance(v, collections.Mapping):
-            r = update_nested_dict(d.get(k, {}), v)
-            d[k] = r
-        else:
-            d[k] = u[k]
-    return d
+    return merge_dicts(d, u)
 
 
 def make_from_params(model, params):
@@ -117,26 +661,105 @@ def make_from_params(model, params):
     return model(**params)
 
 
+def make_from_params_list(model, params_list, create=False, batch_size=None):
+    """Batch version of make_from_params, existing instances fetched with
+    single query and updated with rest of params, new instances
+    optionally created with bulk_create"""
+
+    to_python = model._meta.pk.to_python
+
+    ids = set(
+        to_python(params['id']) for params in params_list
+        if params.get('id', None))
+    existing = model.objects.in_bulk(list(ids)) if ids else {}
+
+    missing = ids.difference(existing)
+    if missing:
+        raise model.DoesNotExist(
+            '{} matching ids does not exist: {}'.format(
+                model._meta.object_name,
+                ', '.join(map(str, sorted(missing)))))
+
+    instances, new = [], []
+    for params in params_list:
+        if params.get('id', None):
+            instance = existing[to_python(params['id'])]
+            for key, value in params.items():
+                if key != 'id':
+                    setattr(instance, key, value)
+        else:
+            instance = model(**params)
+            new.append(instance)
+        instances.append(instance)
+
+    if create and new:
+        model.objects.bulk_create(new, batch_size=batch_size)
+
+    return instances
+
+
 def model_settings(model, name):
     """Get specific settings from model"""
 
     return getattr(getattr(model, 'Settings', {}), name, {})
 
 
+def user_group_names(user):
+    """Frozenset of user group names, resolved once and stored on user
+    object, which lives for single request"""
+
+    names = getattr(user, '_mtr_group_names', None)
+    if names is not None:
+        return names
+
+    if user is None or not user.is_authenticated():
+        return frozenset()
+
+    if 'groups' in getattr(user, '_prefetched_objects_cache', {}):
+        names = frozenset(group.name for group in user.groups.all())
+    else:
+        names = frozenset(user.groups.values_list('name', flat=True))
+
+    user._mtr_group_names = names
+    return names
+
+
+def clear_user_group_names(user):
+    """Forget stored group names, works with lazy request.user too"""
+
+    try:
+        del user._mtr_group_names
+    except AttributeError:
+        pass
+
+
+def in_groups(user, names, require_all=False):
+    """Check if user in any or in all of listed groups"""
+
+    if isinstance(names, six.string_types):
+        names = (names,)
+
+    groups = user_group_names(user)
+    if require_all:
+        return groups.issuperset(names)
+    return not groups.isdisjoint(names)
+
+
 def in_group_plain(user, name):
     """Check user name if listed in groups"""
 
-    return name in list(map(lambda g: g.name, user.groups.all()))
+    return in_groups(user, name)
 
 
-def in_group(name):
-    """Check if user in group and run view func or raise PermissionDenied"""
+def in_group(name, require_all=False):
+    """Check if user in group and run view func or raise PermissionDenied,
+    name can be list of groups"""
 
     def decorator(f):
 
         @wraps(f)
         def wrapper(request, *args, **kwargs):
-            if in_group_plain(request.user, name):
+            if in_groups(request.user, name, require_all):
                 return f(request, *args, **kwargs)
             else:
                 raise PermissionDenied
@@ -146,23 +769,248 @@ def in_group(name):
     return decorator
 
 
-def update_instance(instance, attrs):
-    """Updates instance with given attrs dict"""
+_missing = object()
 
+
+def changed_attrs(instance, attrs):
+    """Return dict of attrs which differs from instance values,
+    related instances compared by primary key"""
+
+    fields = dict(
+        (field.name, field) for field in instance._meta.concrete_fields)
+
+    changed = {}
     for key, value in attrs.items():
+        field = fields.get(key, None)
+        if field is not None and field.is_relation:
+            current = getattr(instance, field.attname)
+            compared = value.pk if isinstance(value, models.Model) \
+                else value
+        else:
+            current = getattr(instance, key, _missing)
+            compared = value
+
+        if current != compared:
+            changed[key] = value
+    return changed
+
+
+def _auto_now_fields(model):
+    return [
+        field for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now', False)]
+
+
+def _auto_now_values(model):
+    """Values for auto_now fields, which are skipped by QuerySet.update"""
+
+    now, today = timezone.now(), date.today()
+    return dict(
+        (field.name, now if isinstance(field, models.DateTimeField)
+            else today)
+        for field in _auto_now_fields(model))
+
+
+def update_instance(instance, attrs, save=True):
+    """Updates instance with given attrs dict,
+    saves only changed fields and skips saving when nothing changed"""
+
+    changed = changed_attrs(instance, attrs)
+    for key, value in changed.items():
         setattr(instance, key, value)
-    instance.save()
+
+    if save and changed:
+        fields = set(chain.from_iterable(
+            (field.name, field.attname)
+            for field in instance._meta.concrete_fields))
+        if instance._state.adding or not fields.issuperset(changed):
+            instance.save()
+        else:
+            instance.save(update_fields=list(changed.keys()) + [
+                field.name for field in _auto_now_fields(instance)
+                if field.name not in changed])
 
     return instance
 
 
-def find_dublicates(model, fields):
-    """Find all dublicate instances and returns queryset"""
+def update_instances(objects, attrs, batch_size=500):
+    """Update queryset or list of instances with attrs dict or callable
+    returning attrs for instance, instances with same changes updated with
+    single query, returns count of updated rows"""
 
-    duplicates = model.objects.values(fields).order_by() \
-        .annotate(max_id=models.Max('id'), count_id=models.Count('id')) \
+    if isinstance(objects, models.QuerySet):
+        if callable(attrs):
+            objects = list(objects)
+        else:
+            values = _auto_now_values(objects.model)
+            values.update(attrs)
+            return objects.exclude(**attrs).update(**values)
+
+    groups = {}
+    for instance in objects:
+        changed = changed_attrs(
+            instance, attrs(instance) if callable(attrs) else attrs)
+        if not changed:
+            continue
+
+        for key, value in changed.items():
+            setattr(instance, key, value)
+
+        group = groups.setdefault(
+            (instance.__class__, tuple(sorted(changed.items()))), [])
+        group.append(instance.pk)
+
+    updated = 0
+    with transaction.atomic():
+        for (model, changed), pks in groups.items():
+            values = _auto_now_values(model)
+            values.update(changed)
+            for batch in chunks(pks, batch_size):
+                updated += model._default_manager \
+                    .filter(pk__in=batch).update(**values)
+    return updated
+
+
+def dublicate_groups_queryset(model, fields, keep='newest'):
+    """Return values queryset of dublicate groups by fields
+    with count and kept primary key (max for newest, min for oldest)"""
+
+    if isinstance(fields, six.string_types):
+        fields = (fields,)
+    aggregate = models.Max if keep == 'newest' else models.Min
+
+    return model._default_manager.values(*fields).order_by() \
+        .annotate(keep_id=aggregate('pk'), count_id=models.Count('pk')) \
         .filter(count_id__gt=1)
-    return model.objects.filter(id__in=map(lambda d: d['max_id'], duplicates))
+
+
+def find_dublicates(model, fields, keep='newest'):
+    """Find kept instance of every dublicate group and return queryset,
+    groups are selected by subquery instead of list of ids"""
+
+    duplicates = dublicate_groups_queryset(model, fields, keep=keep)
+    return model._default_manager.filter(
+        pk__in=duplicates.values_list('keep_id', flat=True))
+
+
+def dublicate_groups(model, fields, keep='newest', batch_size=100):
+    """Stream dublicate groups from database in lists of batch_size"""
+
+    return iterable_chunks(
+        dublicate_groups_queryset(model, fields, keep=keep).iterator(),
+        batch_size)
+
+
+def _dublicates_batches(model, fields, keep, batch_size):
+    """Yield batches of (keep_id, dublicate ids) for groups, resolved
+    groups disappear so first batch is queried again every time"""
+
+    if isinstance(fields, six.string_types):
+        fields = (fields,)
+    queryset = dublicate_groups_queryset(model, fields, keep=keep)
+
+    while True:
+        groups = list(queryset[:batch_size])
+        if not groups:
+            break
+
+        keep_ids = dict(
+            (tuple(g[f] for f in fields), g['keep_id']) for g in groups)
+        condition = models.Q()
+        for group in groups:
+            condition |= models.Q(**dict((f, group[f]) for f in fields))
+
+        dublicates = {}
+        rows = model._default_manager.filter(condition) \
+            .exclude(pk__in=list(keep_ids.values())) \
+            .values_list('pk', *fields)
+        for row in rows.iterator():
+            keep_id = keep_ids.get(tuple(row[1:]), None)
+            if keep_id is not None:
+                dublicates.setdefault(keep_id, []).append(row[0])
+
+        if not dublicates:
+            break
+
+        yield dublicates
+
+
+def delete_dublicates(model, fields, keep='newest', batch_size=100):
+    """Delete all but kept instance in every dublicate group
+    by batches of groups and return count of deleted instances"""
+
+    deleted = 0
+    for dublicates in _dublicates_batches(model, fields, keep, batch_size):
+        with transaction.atomic():
+            ids = chain.from_iterable(dublicates.values())
+            for ids in chunks(ids, batch_size):
+                deleted += len(ids)
+                model._default_manager.filter(pk__in=ids).delete()
+    return deleted
+
+
+def _repoint_relation(model, rel, keep_id, ids):
+    """Repoint rows of related model from dublicates to kept instance,
+    rows which would break unique constraints are deleted"""
+
+    field = rel.field
+    manager = rel.related_model._base_manager
+    lookup = '{}__in'.format(field.attname)
+
+    # foreign keys could point to field other than primary key
+    values = dict(model._base_manager.filter(pk__in=[keep_id] + list(ids))
+                  .values_list('pk', field.target_field.attname))
+    keep_value = values.pop(keep_id)
+    old_values = list(values.values())
+
+    meta = rel.related_model._meta
+    uniques = [
+        names for names in meta.unique_together if field.name in names]
+    if field.unique:
+        uniques.append((field.name,))
+
+    for names in uniques:
+        others = [
+            meta.get_field(name).attname
+            for name in names if name != field.name]
+        seen = set(
+            row[1:] for row in manager.filter(
+                **{field.attname: keep_value}).values_list('pk', *others))
+
+        conflicts = []
+        for row in manager.filter(**{lookup: old_values}) \
+                .values_list('pk', *others):
+            if row[1:] in seen:
+                conflicts.append(row[0])
+            else:
+                seen.add(row[1:])
+        manager.filter(pk__in=conflicts).delete()
+
+    manager.filter(**{lookup: old_values}) \
+        .update(**{field.attname: keep_value})
+
+
+def merge_dublicates(model, fields, keep='newest', batch_size=100):
+    """Repoint foreign keys, including many to many through tables,
+    from dublicates to kept instance, then delete dublicates,
+    returns deleted count, related rows which would break unique
+    constraints are deleted, one to one relations of dublicates
+    are not merged and follow on_delete of their field"""
+
+    relations = [
+        rel for rel in model._meta.get_fields(include_hidden=True)
+        if rel.auto_created and not rel.concrete and rel.one_to_many]
+
+    deleted = 0
+    for dublicates in _dublicates_batches(model, fields, keep, batch_size):
+        with transaction.atomic():
+            for keep_id, ids in dublicates.items():
+                for ids in chunks(ids, batch_size):
+                    for rel in relations:
+                        _repoint_relation(model, rel, keep_id, ids)
+                    model._default_manager.filter(pk__in=ids).delete()
+                    deleted += len(ids)
+    return deleted
 
 
 def absolute_url(path):
@@ -177,16 +1025,43 @@ def relative_media_url(path):
     return urljoin(settings.MEDIA_URL, path.lstrip('/'))
 
 
+_models_cache = {}
+
+
+def _models_registry():
+    """Return tuple of models filtered by sync settings and dict
+    of them by app name, built once after models are loaded"""
+
+    registry = _models_cache.get('registry', None)
+    if registry is None:
+        from django.apps import apps
+
+        mlist = tuple(
+            m for m in apps.get_models()
+            if model_settings(m, 'sync').get('ignore', False))
+        registry = (mlist, dict((model_app_name(m), m) for m in mlist))
+
+        if apps.models_ready:
+            _models_cache['registry'] = registry
+    return registry
+
+
+def clear_models_cache(**kwargs):
+    """Clear cached models, connected to app registry changes"""
+
+    _models_cache.clear()
+
+
 def models_list():
     """Return all registered models"""
 
-    from django.apps import apps
+    return iter(_models_registry()[0])
 
-    mlist = apps.get_models()
-    mlist = (m for m in mlist
-             if model_settings(m, 'sync').get('ignore', False))
 
-    return mlist
+def model_by_name(name):
+    """Return registered model by app_label.model name or None"""
+
+    return _models_registry()[1].get(name, None)
 
 
 def model_app_name(model):
@@ -208,22 +1083,88 @@ def model_choices(empty=True):
                 model._meta.verbose_name.title()))
 
 
+def _active_catalog(language):
+    # no language is active after deactivate_all or override(None)
+    if not settings.USE_I18N or language is None:
+        return None
+
+    from django.utils.translation import trans_real
+
+    return trans_real.translation(language)
+
+
+def cached_model_choices(empty=True):
+    """Return tuple of model_choices cached per active language,
+    cache is cleared with models cache or when translations reloaded"""
+
+    language = get_language()
+    catalog = _active_catalog(language)
+    cache = _models_cache.setdefault('choices', {})
+
+    cached = cache.get(language, None)
+    if cached is None or cached[0] is not catalog:
+        cached = cache[language] = (catalog, tuple(model_choices(False)))
+
+    choices = cached[1]
+    return (('', '-' * 9),) + choices if empty else choices
+
+
+_method_wrapper_classes = {}
+
+
+def _delegate_method(m_from, m_to):
+    def method(self, *args, **kwargs):
+        return getattr(self.instance, m_from)(*args, **kwargs)
+
+    method.__name__ = str(m_to)
+    return method
+
+
+def method_wrapper_class(bind, base=None):
+    """Return cached wrapper class with delegate methods for bind
+    specification, list of (template, names) pairs"""
+
+    base = base or MethodWrapper
+    bind = tuple((template, tuple(names)) for template, names in bind or ())
+
+    key = (base, bind)
+    cls = _method_wrapper_classes.get(key, None)
+    if cls is None:
+        namespace = {'__slots__': (), 'bind': bind, '_generated': True}
+        for template, names in bind:
+            for name in names:
+                namespace[name] = _delegate_method(
+                    template.format(name), name)
+
+        cls = _method_wrapper_classes.setdefault(
+            key, type(base.__name__, (base,), namespace))
+    return cls
+
+
 class MethodWrapper(object):
     """
     Used for exposing private and long methods to simple class with
     public human readable names. For example using them in django templates
     """
 
-    def __init__(self, instance, bind=None):
-        self.instance = instance
-        self.bind = bind or []
+    __slots__ = ('instance',)
 
-        for template, names in bind:
-            for name in names:
-                self._bind_method(template.format(name), name)
+    bind = ()
 
-    def _bind_method(self, m_from, m_to):
-        def func(self, *args, **kwargs):
-            return getattr(self.instance, m_from)(*args, **kwargs)
+    def __new__(cls, instance, bind=None):
+        if not cls.__dict__.get('_generated', False):
+            cls = method_wrapper_class(
+                cls.bind if bind is None else bind, base=cls)
+        return super(MethodWrapper, cls).__new__(cls)
 
-        setattr(self, m_to, types.MethodType(func, self))
+    def __init__(self, instance, bind=None):
+        if bind is not None:
+            # subclasses can pass bind from their own __init__
+            cls = type(self)
+            base = cls.__bases__[0] if cls.__dict__.get('_generated', False) \
+                else cls
+            cls = method_wrapper_class(bind, base=base)
+            if cls is not type(self):
+                self.__class__ = cls
+
+        self.instance = instance
@@ -0,0 +1,25 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand
+
+from ...models.mixins import refresh_live_published
+
+
+class Command(BaseCommand):
+    help = 'Refresh is_live flag of LivePublishedMixin models, ' \
+        'run it periodically to apply publish schedule'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'models', nargs='*', metavar='app_label.ModelName',
+            help='Models to refresh, all live published models by default')
+
+    def handle(self, *args, **options):
+        models_list = [
+            apps.get_model(label) for label in options['models']] or None
+
+        for model, (activated, deactivated) in \
+                refresh_live_published(models_list).items():
+            if options['verbosity'] > 0:
+                self.stdout.write('{}.{}: {} activated, {} deactivated'.format(
+                    model._meta.app_label, model._meta.object_name,
+                    activated, deactivated))
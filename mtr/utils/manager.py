@@ -1,68 +1,449 @@
+import os
+import json
+import time
+import bisect
+import hashlib
+import inspect
 import importlib
+import threading
+import multiprocessing
 
+from timeit import default_timer
 from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, \
+    TimeoutError, wait, FIRST_COMPLETED
 
-from .helpers import update_nested_dict
+from django.utils import six
+
+from .helpers import merge_dicts
+from .memoize import Memoized
+from .metrics import HandlerMetrics
+from .settings import SETTINGS
+
+
+def timed_call(func, args, kwargs):
+    """Call func and return (elapsed, result, error) for metrics"""
+
+    start = default_timer()
+    try:
+        result = func(*args, **kwargs)
+    except Exception as e:
+        return default_timer() - start, None, e
+    return default_timer() - start, result, None
+
+
+def _is_coroutine_function(func):
+    check = getattr(inspect, 'iscoroutinefunction', None)
+    return getattr(func, '_is_coroutine', None) is not None or \
+        check is not None and check(func)
+
+
+class LazyHandler(object):
+
+    """Handler registered by dotted path, imported on first use"""
+
+    def __init__(self, path):
+        self.path = path
+        self._func = None
+
+        if ':' in path:
+            module, name = path.split(':')
+        else:
+            module, name = path.rsplit('.', 1)
+
+        self.__module__ = module
+        self.__name__ = name
+
+    def resolve(self):
+        func = self._func
+        if func is None:
+            func = getattr(
+                importlib.import_module(self.__module__), self.__name__)
+            func.label = getattr(self, 'label', None)
+            func.position = getattr(self, 'position', 0)
+            self._func = func
+        return func
+
+    def __call__(self, *args, **kwargs):
+        return self.resolve()(*args, **kwargs)
+
+    def __repr__(self):
+        return '<LazyHandler: {}>'.format(self.path)
+
+
+class DispatchError(Exception):
+
+    """Raised after dispatch with exceptions of failed handlers"""
+
+    def __init__(self, errors, results=None):
+        self.errors = errors
+        self.results = results if results is not None else OrderedDict()
+
+        super(DispatchError, self).__init__(
+            'Handlers failed: {}'.format(', '.join(errors.keys())))
+
+
+class Snapshot(object):
+
+    """Registry state, never changed after creation, writers replace
+    whole snapshot and readers compile it once without locking"""
+
+    __slots__ = ('registered', 'compiled')
+
+    def __init__(self, registered):
+        self.registered = registered
+        self.compiled = None
+
+    def compile(self):
+        """Return flat (type_name, related, name) index and
+        position ordered items"""
+
+        compiled = self.compiled
+        if compiled is None:
+            index, items = {}, {}
+            for type_name, values in self.registered.items():
+                ordered = []
+                for key, value in values.items():
+                    index[(type_name, None, key)] = value
+                    if isinstance(value, dict):
+                        items[(type_name, key)] = tuple(value.items())
+                        for name, func in value.items():
+                            index[(type_name, key, name)] = func
+                    else:
+                        ordered.append((key, value))
+                items[(type_name, None)] = tuple(ordered)
+            compiled = self.compiled = (index, items)
+        return compiled
 
 
 class BaseManager(object):
 
-    """Manager for different kind of functions"""
+    """Manager for different kind of functions, registry is copied on
+    write under lock so reading from many threads needs no locking"""
 
-    def __init__(self, use_module_name=False):
-        self._registered = {}
+    EXECUTORS = {
+        'thread': ThreadPoolExecutor,
+        'process': ProcessPoolExecutor,
+    }
+
+    def __init__(
+            self, use_module_name=False, executor='thread', max_workers=None,
+            metrics=False):
+        self._state = Snapshot({})
+        self._lock = threading.RLock()
+        self._positions = {}
+        self._frozen = False
         self._imported = False
+        self._importing = False
+        self._pending = None
+        self._discovered = set()
         self._use_module_name = use_module_name
+        self._executor = None
+        self._executor_class = executor
+        self._max_workers = max_workers
+        self._metrics = HandlerMetrics() if metrics else None
+
+    @property
+    def _registered(self):
+        return self._state.registered
 
     def all(self, type_name, related=None):
-        funcs = self._registered.get(type_name, {})
+        if self._pending is not None:
+            self._import_pending()
+
+        funcs = self._state.registered.get(type_name, {})
         if related and funcs:
             funcs = funcs.get(related, {})
         return funcs
 
+    def items(self, type_name, related=None):
+        """Return position ordered tuple of (name, func) pairs"""
+
+        return self._snapshot()[1].get((type_name, related), ())
+
     def get(self, type_name, func_name, related=None):
-        funcs = self.all(type_name, related=related)
-        return funcs.get(func_name, None)
+        func = self._snapshot()[0].get((type_name, related, func_name), None)
+        if isinstance(func, LazyHandler):
+            func = func.resolve()
+        return func
+
+    def freeze(self):
+        """Compile registry and forbid any further changes"""
+
+        with self._lock:
+            self._snapshot()
+            self._frozen = True
+
+        return self
+
+    def call(self, type_name, func_name, args=(), kwargs=None, related=None):
+        """Call registered handler by name"""
+
+        func = self.get(type_name, func_name, related=related)
+        if func is None:
+            raise KeyError('{} is not registred at {}'.format(
+                func_name, type_name))
+
+        if self._metrics is None:
+            return func(*args, **(kwargs or {}))
+
+        elapsed, result, error = timed_call(func, args, kwargs or {})
+        self._metrics.record(
+            (type_name, related, func_name), elapsed, error is not None)
+        if error is not None:
+            raise error
+        return result
+
+    def call_all(
+            self, type_name, args=(), kwargs=None, related=None,
+            timeout=None):
+        """Call all handlers of type concurrently and return ordered dict
+        of results, raises DispatchError with results if any failed"""
+
+        results = OrderedDict()
+        try:
+            for name, result in self.imap(
+                    type_name, args, kwargs, related=related,
+                    timeout=timeout):
+                results[name] = result
+        except DispatchError as e:
+            e.results = results
+            raise
+        return results
+
+    def imap(
+            self, type_name, args=(), kwargs=None, related=None,
+            ordered=True, timeout=None):
+        """Run all handlers of type in executor and yield (name, result)
+        in position order or as completed, timeout in seconds is counted
+        from dispatch for every handler and can be dict by handler name,
+        DispatchError is raised at the end if any handler failed"""
+
+        executor = self._get_executor()
+        kwargs = kwargs or {}
+        start = time.time()
+
+        futures = OrderedDict()
+        deadlines = {}
+        for name, func in self.items(type_name, related=related):
+            if self._metrics is None:
+                future = executor.submit(func, *args, **kwargs)
+            else:
+                future = executor.submit(timed_call, func, args, kwargs)
+            futures[future] = name
+
+            limit = timeout.get(name, None) \
+                if isinstance(timeout, dict) else timeout
+            deadlines[future] = start + limit if limit is not None else None
+
+        errors = OrderedDict()
+
+        if ordered:
+            for future, name in futures.items():
+                deadline = deadlines[future]
+                try:
+                    result = self._result(
+                        future, (type_name, related, name),
+                        None if deadline is None
+                        else max(0, deadline - time.time()))
+                except Exception as e:
+                    future.cancel()
+                    errors[name] = e
+                else:
+                    yield name, result
+        else:
+            pending = set(futures)
+            while pending:
+                limits = [
+                    deadlines[f] for f in pending if deadlines[f] is not None]
+                done, pending = wait(
+                    pending, return_when=FIRST_COMPLETED,
+                    timeout=max(0, min(limits) - time.time())
+                    if limits else None)
+
+                now = time.time()
+                for future, name in futures.items():
+                    if future in done:
+                        try:
+                            result = self._result(
+                                future, (type_name, related, name))
+                        except Exception as e:
+                            errors[name] = e
+                        else:
+                            yield name, result
+                    elif future in pending and \
+                            deadlines[future] is not None and \
+                            deadlines[future] <= now:
+                        future.cancel()
+                        pending.discard(future)
+                        errors[name] = TimeoutError()
+                        if self._metrics is not None:
+                            self._metrics.record(
+                                (type_name, related, name), None, True)
+
+        if errors:
+            raise DispatchError(errors)
+
+    def _result(self, future, key, timeout=None):
+        """Return future result and record metrics if enabled"""
+
+        metrics = self._metrics
+        try:
+            result = future.result(timeout)
+        except Exception:
+            if metrics is not None:
+                metrics.record(key, None, True)
+            raise
+
+        if metrics is not None:
+            elapsed, result, error = result
+            metrics.record(key, elapsed, error is not None)
+            if error is not None:
+                raise error
+        return result
+
+    def metrics(self):
+        """Return handler stats by (type_name, related, name),
+        only calls made through manager dispatch are recorded"""
+
+        if self._metrics is None:
+            return {}
+        return self._metrics.as_dict()
+
+    def enable_metrics(self, enabled=True):
+        self._metrics = HandlerMetrics() if enabled else None
+
+    def reset_metrics(self):
+        if self._metrics is not None:
+            self._metrics.reset()
+
+    def acall_all(
+            self, type_name, args=(), kwargs=None, related=None,
+            concurrency=None, timeout=None):
+        """Return coroutine gathering coroutine and sync handlers of type,
+        sync handlers are offloaded to dispatch executor"""
+
+        from .aio import call_all
+
+        return call_all(
+            self, type_name, args, kwargs, related=related,
+            concurrency=concurrency, timeout=timeout)
+
+    def shutdown(self, wait=True):
+        """Shutdown executor used for dispatch"""
+
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+    def _get_executor(self):
+        executor = self._executor
+        if executor is None:
+            executor = self._executor_class
+            if isinstance(executor, six.string_types):
+                # python 3.4 and futures backport require max_workers
+                max_workers = self._max_workers
+                if max_workers is None:
+                    max_workers = multiprocessing.cpu_count() or 1
+                    if executor == 'thread':
+                        max_workers *= 5
+                executor = self.EXECUTORS[executor](max_workers=max_workers)
+            self._executor = executor
+        return executor
+
+    def _snapshot(self):
+        if self._pending is not None:
+            self._import_pending()
+
+        return self._state.compile()
+
+    def _check_frozen(self):
+        if self._frozen:
+            raise RuntimeError('{} is frozen'.format(
+                self.__class__.__name__))
 
     def _make_func_name(self, func):
         if self._use_module_name:
             return '{}.{}'.format(func.__module__, func.__name__)
         return func.__name__
 
+    def _insert(self, values, key, name, func, position):
+        """Insert func into position ordered dict using bisect"""
+
+        positions = self._positions.get(key, None)
+        if positions is None or len(positions) != len(values):
+            positions = [
+                getattr(v, 'position', 0) for v in values.values()]
+
+        index = bisect.bisect_right(positions, position)
+        positions.insert(index, position)
+        self._positions[key] = positions
+
+        if index == len(values):
+            values[name] = func
+            return values
+
+        items = list(values.items())
+        items.insert(index, (name, func))
+        return OrderedDict(items)
+
     def _register_dict(
             self, type_name, label, func_name, related=None, **kwargs):
         """Return decorator for adding functions as key, value
         to instance, dict"""
 
         def decorator(func):
-            # TODO: refactor, too complicated
-
-            key = type_name
-            values = self._registered.get(key, OrderedDict())
-            outer = None
-            if related:
-                outer = values
-                values = values.get(related, OrderedDict())
             position = \
                 getattr(func, 'position', 0) or kwargs.get('position', 0)
 
             new_name = func_name or self._make_func_name(func)
             func.label = label
+            func.position = position
+
+            handler = func
+            cache = kwargs.get('cache', None)
+            if cache:
+                if _is_coroutine_function(func):
+                    raise ValueError(
+                        'coroutine handler {} can not be cached'.format(
+                            new_name))
+                if cache is True:
+                    cache = {}
+                elif not isinstance(cache, dict):
+                    cache = {'maxsize': cache}
+                handler = Memoized(func, **cache)
+
+            with self._lock:
+                self._check_frozen()
 
-            if values.get(new_name, None) is not None:
-                raise ValueError(
-                    '{} already registred at {}'.format(new_name, key))
-
-            values[new_name] = func
-            if position:
-                values = OrderedDict(
-                    sorted(
-                        values.items(),
-                        key=lambda p: getattr(p[1], 'position', 0)))
-            if related:
-                outer[related] = values
-                values = outer
-            self._registered[key] = values
+                registered = dict(self._state.registered)
+                values = OrderedDict(registered.get(type_name, ()))
+
+                if related:
+                    inner = values.get(related, None)
+                    if inner is None:
+                        values = self._insert(
+                            values, (type_name, None), related,
+                            OrderedDict(), 0)
+                    inner = OrderedDict(values[related])
+                    if inner.get(new_name, None) is not None:
+                        raise ValueError(
+                            '{} already registred at {}'.format(
+                                new_name, type_name))
+                    values[related] = self._insert(
+                        inner, (type_name, related),
+                        new_name, handler, position)
+                else:
+                    if values.get(new_name, None) is not None:
+                        raise ValueError(
+                            '{} already registred at {}'.format(
+                                new_name, type_name))
+                    values = self._insert(
+                        values, (type_name, None),
+                        new_name, handler, position)
+
+                registered[type_name] = values
+                self._state = Snapshot(registered)
 
             return func
 
@@ -71,7 +452,13 @@ class BaseManager(object):
     def register(
             self, type_name, label=None, name=None,
             item=None, **kwargs):
-        """Decorator and function to config new handlers"""
+        """Decorator and function to config new handlers,
+        item can be dotted path to handler for lazy import,
+        cache can be True, maxsize or dict with maxsize and ttl
+        for memoizing handler results"""
+
+        if isinstance(item, six.string_types):
+            item = LazyHandler(item)
 
         func = self._register_dict(type_name, label, name, **kwargs)
 
@@ -80,31 +467,218 @@ class BaseManager(object):
     def unregister(self, type_name, item=None, related=None):
         """Decorator to pop dict items"""
 
-        items = self._registered.get(type_name, None)
-        if items:
-            if related:
-                items = items.get(related, {})
-            items.pop(getattr(item, '__name__', item), None)
+        name = getattr(item, '__name__', item)
+
+        with self._lock:
+            registered = self._state.registered
+            values = registered.get(type_name, None)
+            if values:
+                self._check_frozen()
+
+                registered = dict(registered)
+                values = OrderedDict(values)
+                registered[type_name] = values
+                if related:
+                    if related not in values:
+                        return item
+                    values[related] = OrderedDict(values[related])
+                    values = values[related]
+                values.pop(name, None)
+
+                self._positions.pop((type_name, related), None)
+                self._state = Snapshot(registered)
 
         return item
 
+    def invalidate(self, type_name, related=None):
+        """Clear memoized results of handlers of type"""
+
+        for key, func in self._snapshot()[0].items():
+            if key[0] == type_name and \
+                    (related is None or key[1] == related) and \
+                    isinstance(func, Memoized):
+                func.cache_clear()
+
     def update(self, manager):
-        update_nested_dict(self._registered, manager._registered)
+        if manager._pending is not None:
+            manager._import_pending()
+        other = manager._registered
+
+        with self._lock:
+            self._check_frozen()
 
-    def import_modules(self, modules):
-        """Import modules within additional paths"""
+            registered = merge_dicts(
+                self._state.registered, other, inplace=False)
 
-        if not self._imported:
-            for module in modules:
-                name = 'manager'
-                if ':' in module:
-                    module, name = module.split(':')
-                module = importlib.import_module(module)
-                self.update(getattr(module, name))
+            for type_name in other.keys():
+                registered[type_name] = self._sorted(registered[type_name])
 
+            self._positions.clear()
+            self._state = Snapshot(registered)
+
+    def _sorted(self, values):
+        items = []
+        for key, value in values.items():
+            if isinstance(value, dict):
+                value = self._sorted(value)
+            items.append((key, value))
+        return OrderedDict(sorted(
+            items, key=lambda p: getattr(p[1], 'position', 0)))
+
+    def import_modules(self, modules, lazy=False):
+        """Import modules within additional paths,
+        lazy import is deferred until registry first accessed"""
+
+        with self._lock:
+            if self._imported:
+                return
+
+            modules = list(self._pending or ()) + list(modules)
+            if lazy:
+                self._pending = modules
+                return
+
+            self._importing = True
+            try:
+                for module in modules:
+                    name = 'manager'
+                    if ':' in module:
+                        module, name = module.split(':')
+                    module = importlib.import_module(module)
+                    self.update(getattr(module, name))
+            finally:
+                self._importing = False
+
+            self._pending = None
             self._imported = True
 
-    def import_from_app_list(self, app_list):
-        # TODO: cover from django app list
+    def _import_pending(self):
+        with self._lock:
+            if self._pending is not None and not self._importing:
+                self.import_modules(())
+
+    def manifest(self):
+        """Return registered handler names and positions by type"""
+
+        manifest = {}
+        for (type_name, related), items in self._snapshot()[1].items():
+            handlers = manifest.setdefault(type_name, [])
+            for name, func in items:
+                handlers.append(
+                    [related, name, getattr(func, 'position', 0)])
+        return manifest
+
+    def import_from_app_list(
+            self, app_list=None, type_name=None,
+            module='manager', name='manager', manifest_dir=None):
+        """Autodiscover managers in django apps, modules with handlers
+        are stored in manifest file to skip probing on next start"""
+
+        key = (type_name, module, name)
+        with self._lock:
+            if key in self._discovered:
+                return
+            self._discovered.add(key)
+
+        modules = self._app_modules(app_list, module)
+        path = self._manifest_path(modules, module, name, manifest_dir)
+        manifest = self._read_manifest(path, modules)
+
+        def matches(types):
+            return type_name is None or type_name in types
+
+        managers = {}
+        if manifest is not None:
+            for module_path, types in manifest.items():
+                if matches(types):
+                    manager = getattr(
+                        importlib.import_module(module_path), name, None)
+                    if not isinstance(manager, BaseManager):
+                        # stale manifest, probe modules again
+                        manifest = None
+                        break
+                    managers[module_path] = manager
+
+        if manifest is None:
+            manifest = {}
+            for module_path in modules:
+                manager = getattr(
+                    importlib.import_module(module_path), name, None)
+                if isinstance(manager, BaseManager):
+                    manifest[module_path] = manager.manifest()
+                    managers[module_path] = manager
+            self._write_manifest(path, manifest)
+
+        for module_path, types in manifest.items():
+            if matches(types):
+                self.update(managers[module_path])
+
+    def _app_modules(self, app_list, module):
+        """Return module paths with files and mtimes
+        found in apps without importing them"""
+
+        if app_list is None:
+            from django.apps import apps
+
+            paths = [(c.name, c.path) for c in apps.get_app_configs()]
+        else:
+            paths = []
+            for app in app_list:
+                package = importlib.import_module(app)
+                for path in getattr(package, '__path__', [])[:1]:
+                    paths.append((app, path))
+
+        modules = {}
+        for app, path in paths:
+            for filename in (
+                    os.path.join(path, '{}.py'.format(module)),
+                    os.path.join(path, module, '__init__.py')):
+                if os.path.exists(filename):
+                    modules['{}.{}'.format(app, module)] = \
+                        (filename, os.path.getmtime(filename))
+                    break
+        return modules
+
+    def _manifest_path(self, modules, module, name, manifest_dir=None):
+        manifest_dir = manifest_dir or \
+            SETTINGS.get('manager', {}).get('manifest_dir', None)
+        if not manifest_dir:
+            return None
+
+        key = json.dumps(
+            [module, name, sorted(modules.items())], sort_keys=True)
+        key = hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+        return os.path.join(
+            manifest_dir, 'mtr_utils_manager_{}.json'.format(key))
+
+    def _read_manifest(self, path, modules):
+        """Read manifest, which is trusted only when it lists
+        discovered app modules with handlers by type"""
+
+        if path is None or not os.path.exists(path):
+            return None
+
+        try:
+            with open(path) as f:
+                manifest = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+
+        if not isinstance(manifest, dict) or any(
+                module_path not in modules or not isinstance(types, dict)
+                for module_path, types in manifest.items()):
+            return None
+        return manifest
+
+    def _write_manifest(self, path, manifest):
+        if path is None:
+            return
 
-        pass
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(manifest, f)
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            pass
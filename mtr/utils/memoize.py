@@ -0,0 +1,97 @@
+import threading
+
+from timeit import default_timer
+from functools import update_wrapper
+from collections import OrderedDict
+
+
+class LRUCache(object):
+
+    """Thread safe LRU cache bounded by maxsize with optional ttl"""
+
+    def __init__(self, maxsize=128, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, None)
+            if item is None:
+                return default
+
+            value, expires = item
+            if expires is not None and expires < default_timer():
+                del self._data[key]
+                return default
+
+            del self._data[key]
+            self._data[key] = item
+            return value
+
+    def set(self, key, value):
+        expires = default_timer() + self.ttl if self.ttl else None
+
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, expires)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class Memoized(object):
+
+    """Callable caching results by arguments,
+    calls with unhashable arguments are not cached"""
+
+    _missing = object()
+
+    def __init__(self, func, maxsize=128, ttl=None):
+        self.func = func
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.cache = LRUCache(maxsize=maxsize, ttl=ttl)
+        update_wrapper(self, func)
+
+    def __call__(self, *args, **kwargs):
+        key = args
+        if kwargs:
+            key += (self._missing,) + tuple(sorted(kwargs.items()))
+
+        try:
+            result = self.cache.get(key, self._missing)
+        except TypeError:
+            return self.func(*args, **kwargs)
+
+        if result is self._missing:
+            result = self.func(*args, **kwargs)
+            self.cache.set(key, result)
+        return result
+
+    def cache_clear(self):
+        self.cache.clear()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('cache')
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.cache = LRUCache(maxsize=self.maxsize, ttl=self.ttl)
+
+
+def memoize(func=None, maxsize=128, ttl=None):
+    """Decorator and function for caching func results"""
+
+    if func is None:
+        return lambda f: Memoized(f, maxsize=maxsize, ttl=ttl)
+    return Memoized(func, maxsize=maxsize, ttl=ttl)
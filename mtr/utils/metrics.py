@@ -0,0 +1,102 @@
+import math
+import threading
+
+from collections import OrderedDict
+
+
+class Histogram(object):
+
+    """Fixed memory latency histogram with logarithmic buckets,
+    percentiles are accurate within bucket width"""
+
+    def __init__(self, min_value=1e-6, max_value=1e3, precision=20):
+        self.min_value = min_value
+        self.precision = precision
+        self.size = int(math.ceil(
+            math.log10(max_value / min_value) * precision)) + 1
+        self.buckets = [0] * self.size
+        self.count = 0
+
+    def add(self, value):
+        if value <= self.min_value:
+            index = 0
+        else:
+            index = min(self.size - 1, int(
+                math.log10(value / self.min_value) * self.precision))
+        self.buckets[index] += 1
+        self.count += 1
+
+    def percentile(self, percent):
+        """Return upper bound of bucket containing percentile"""
+
+        if not self.count:
+            return None
+
+        rank = max(1, int(math.ceil(self.count * percent / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return self.min_value * 10 ** (
+                    float(index + 1) / self.precision)
+
+    def reset(self):
+        self.buckets = [0] * self.size
+        self.count = 0
+
+
+class HandlerStats(object):
+
+    """Call count, errors and latency of single handler"""
+
+    PERCENTILES = (50, 95, 99)
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total = 0.0
+        self.histogram = Histogram()
+
+    def record(self, elapsed, error=False):
+        self.calls += 1
+        if error:
+            self.errors += 1
+        if elapsed is not None:
+            self.total += elapsed
+            self.histogram.add(elapsed)
+
+    def as_dict(self):
+        stats = OrderedDict((
+            ('calls', self.calls),
+            ('errors', self.errors),
+            ('total', self.total),
+        ))
+        for percent in self.PERCENTILES:
+            stats['p{}'.format(percent)] = \
+                self.histogram.percentile(percent)
+        return stats
+
+
+class HandlerMetrics(object):
+
+    """Thread safe stats by (type_name, related, name) key"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, key, elapsed, error=False):
+        with self._lock:
+            stats = self._stats.get(key, None)
+            if stats is None:
+                stats = self._stats[key] = HandlerStats()
+            stats.record(elapsed, error)
+
+    def as_dict(self):
+        with self._lock:
+            return dict(
+                (key, stats.as_dict()) for key, stats in self._stats.items())
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
@@ -1,11 +1,24 @@
-from django.db import models
+import hashlib
+
+from datetime import datetime, timedelta
+
+from django.apps import apps
+from django.core.cache import caches
+from django.db import models, transaction
 from django.utils import timezone
+from django.utils.six.moves import range
+
+try:
+    from django.core.exceptions import EmptyResultSet
+except ImportError:
+    from django.db.models.sql.datastructures import EmptyResultSet
 
 from slugify import slugify
 from mptt.models import MPTTModel, TreeForeignKey
 from mptt.managers import TreeManager
 
 from .fields import CharNullField
+from ..settings import SETTINGS
 from ..translation import _
 
 
@@ -19,20 +32,161 @@ class SeoMixin(models.Model):
         abstract = True
 
 
+def quantized_now(quantize=None, up=False):
+    """Current time rounded down or up to quantize seconds bucket, so
+    published querysets built in same bucket are identical and can be
+    cached"""
+
+    if quantize is None:
+        quantize = SETTINGS['published']['quantize']
+
+    now = timezone.now()
+    if not quantize:
+        return now
+
+    delta = now - datetime(1970, 1, 1, tzinfo=now.tzinfo)
+    microseconds = (delta.days * 86400 + delta.seconds) * 10 ** 6 \
+        + delta.microseconds
+    bucket = int(quantize) * 10 ** 6
+    if up:
+        return now + timedelta(microseconds=-microseconds % bucket)
+    return now - timedelta(microseconds=microseconds % bucket)
+
+
+def _model_label(model):
+    return '{}.{}'.format(model._meta.app_label, model._meta.model_name)
+
+
+def _published_version_key(model):
+    return '{}:version:{}'.format(
+        SETTINGS['published']['prefix'], _model_label(model))
+
+
+def published_version(model):
+    """Cache version of published model, changed on every save or delete"""
+
+    cache = caches[SETTINGS['published']['cache_alias']]
+    key = _published_version_key(model)
+
+    version = cache.get(key, None)
+    if version is None:
+        version = 1
+        cache.add(key, version, None)
+    return version
+
+
+def expire_published(sender, **kwargs):
+    """Signal receiver, bumps cache version of published models"""
+
+    if not issubclass(sender, PublishedMixin):
+        return
+
+    cache = caches[SETTINGS['published']['cache_alias']]
+    key = _published_version_key(sender)
+
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 2, None)
+
+
 class PublishedQuerySet(models.QuerySet):
 
-    def published(self):
-        return self.filter(published=True, published_at__lt=timezone.now()) \
+    def published(self, now=None, quantize=None):
+        """Filter published items, with quantize seconds, or True for
+        default from settings, bounds are rounded inwards, so items
+        appear and expire up to quantize seconds late and early,
+        but never outside of their publish window"""
+
+        start = end = now or timezone.now()
+        if quantize and now is None:
+            quantize = None if quantize is True else quantize
+            start = quantized_now(quantize)
+            end = quantized_now(quantize, up=True)
+
+        return self.filter(published=True, published_at__lt=start) \
             .filter(
-                models.Q(published_to__gt=timezone.now()) |
+                models.Q(published_to__gt=end) |
                 models.Q(published_to=None))
 
+    def cached(self, ids=False, timeout=None):
+        """Evaluate queryset through cache, keyed by model version
+        and query, returns list of instances or primary keys,
+        use with published(quantize=True) to get same query in bucket"""
+
+        options = SETTINGS['published']
+        try:
+            query = str(self.query)
+        except EmptyResultSet:
+            return []
+
+        key = '{}:{}:{}:{}:{}'.format(
+            options['prefix'], _model_label(self.model),
+            published_version(self.model), 'ids' if ids else 'rows',
+            hashlib.md5(query.encode('utf-8')).hexdigest())
+
+        cache = caches[options['cache_alias']]
+        result = cache.get(key, None)
+        if result is None:
+            result = list(self.values_list('pk', flat=True)) \
+                if ids else list(self)
+            cache.set(
+                key, result,
+                options['timeout'] if timeout is None else timeout)
+        return result
+
+
+class LivePublishedQuerySet(PublishedQuerySet):
+
+    def live(self):
+        return self.filter(is_live=True)
+
+    def refresh_live(self, now=None):
+        """Flip is_live flag of rows crossed publish boundaries,
+        returns count of activated and deactivated rows"""
+
+        now = now or timezone.now()
+
+        activated = self.filter(
+            is_live=False, published=True, published_at__lt=now) \
+            .filter(
+                models.Q(published_to__gt=now) |
+                models.Q(published_to=None)) \
+            .update(is_live=True)
+        deactivated = self.filter(is_live=True) \
+            .filter(
+                models.Q(published=False) |
+                models.Q(published_at__gte=now) |
+                models.Q(published_to__lte=now)) \
+            .update(is_live=False)
+
+        if activated or deactivated:
+            expire_published(self.model)
+
+        return activated, deactivated
+
 
 class PublishedManager(models.Manager):
 
     def get_queryset(self):
         return PublishedQuerySet(self.model, using=self._db).published()
 
+    def get_cached_queryset(self):
+        return PublishedQuerySet(self.model, using=self._db) \
+            .published(quantize=True)
+
+    def cached(self, ids=False, timeout=None):
+        return self.get_cached_queryset().cached(ids=ids, timeout=timeout)
+
+
+class LivePublishedManager(PublishedManager):
+
+    def get_queryset(self):
+        return LivePublishedQuerySet(self.model, using=self._db).live()
+
+    def get_cached_queryset(self):
+        return self.get_queryset()
+
 
 class TreePublishedManager(TreeManager, PublishedManager):
 
@@ -60,10 +214,49 @@ class PublishedMixin(models.Model):
         now = timezone.now()
         published = self.published and self.published_at < now
         if self.published_to:
-            published = published and self.published_to < now
+            published = published and self.published_to > now
         return published
 
 
+class LivePublishedMixin(PublishedMixin):
+
+    """Published mixin with materialized is_live flag,
+    refreshed on save and by refresh_published command"""
+
+    is_live = models.BooleanField(
+        _('live'), default=False, db_index=True, editable=False)
+
+    objects = models.Manager.from_queryset(LivePublishedQuerySet)()
+    published_objects = LivePublishedManager()
+
+    class Meta(PublishedMixin.Meta):
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        self.is_live = bool(self.is_published())
+
+        update_fields = kwargs.get('update_fields', None)
+        if update_fields is not None and 'is_live' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['is_live']
+
+        super(LivePublishedMixin, self).save(*args, **kwargs)
+
+
+def refresh_live_published(models_list=None, now=None):
+    """Refresh is_live flag for all or given LivePublishedMixin models,
+    returns dict of activated and deactivated counts by model"""
+
+    if models_list is None:
+        models_list = [
+            model for model in apps.get_models()
+            if issubclass(model, LivePublishedMixin)]
+
+    now = now or timezone.now()
+    return dict(
+        (model, LivePublishedQuerySet(model).refresh_live(now=now))
+        for model in models_list)
+
+
 class TreePublishedMixin(PublishedMixin):
     objects = TreeManager()
     published_objects = TreePublishedManager()
@@ -86,9 +279,87 @@ class TimeStampedMixin(models.Model):
         ordering = ('-created_at',)
 
 
+class PositionQuerySet(models.QuerySet):
+
+    def next_position(self):
+        """Position after last item, uses index on position"""
+
+        last = self.filter(position__isnull=False).order_by('-position') \
+            .values_list('position', flat=True).first()
+        return 0 if last is None else last + self.model.POSITION_GAP
+
+    def reorder(self, ids, batch_size=250):
+        """Set gapped positions by order of ids,
+        with single UPDATE ... CASE statement per batch"""
+
+        gap = self.model.POSITION_GAP
+        ids = list(ids)
+
+        updated = 0
+        with transaction.atomic(using=self.db):
+            for start in range(0, len(ids), batch_size):
+                batch = ids[start:start + batch_size]
+                updated += self.filter(pk__in=batch).update(
+                    position=models.Case(*[
+                        models.When(pk=pk, then=models.Value(
+                            (start + index) * gap))
+                        for index, pk in enumerate(batch)],
+                        output_field=models.BigIntegerField()))
+        return updated
+
+    def rebalance(self):
+        """Spread positions of all items evenly by POSITION_GAP"""
+
+        return self.reorder(
+            self.order_by('position', 'pk').values_list('pk', flat=True))
+
+    def move_to(self, pk, index):
+        """Move item to index between neighbours, positions of other items
+        changed only when there is no gap left, returns new position"""
+
+        pk = getattr(pk, 'pk', pk)
+        gap = self.model.POSITION_GAP
+        others = self.exclude(pk=pk).order_by('position', 'pk')
+
+        index = max(0, index)
+        start = max(0, index - 1)
+        neighbours = list(
+            others.values_list('position', flat=True)[start:index + 1])
+        if index and not neighbours:
+            neighbours = [
+                others.values_list('position', flat=True).last()]
+        before = neighbours.pop(0) if index and neighbours else None
+        after = neighbours[0] if neighbours else None
+
+        # allocated positions are never negative, so they can not
+        # collide with -1 used for not assigned position
+        if before is None and after is None:
+            position = 0
+        elif before is None:
+            position = after - gap if after >= gap else after // 2
+        elif after is None:
+            position = max(0, before + gap)
+        else:
+            position = (before + after) // 2
+
+        if position < 0 or position == before or \
+                after is not None and position >= after:
+            ids = list(others.values_list('pk', flat=True))
+            ids.insert(index, pk)
+            self.reorder(ids)
+            return ids.index(pk) * gap
+
+        self.filter(pk=pk).update(position=position)
+        return position
+
+
 class PositionRootMixin(models.Model):
+    POSITION_GAP = 1024
+
     position = models.BigIntegerField(
-        _('position'), null=True, blank=True, default=-1)
+        _('position'), null=True, blank=True, default=-1, db_index=True)
+
+    objects = models.Manager.from_queryset(PositionQuerySet)()
 
     class Meta:
         abstract = True
@@ -97,19 +368,64 @@ class PositionRootMixin(models.Model):
 
     def save(self, *args, **kwargs):
         if self.position == -1:
-            self.position = self.__class__.objects \
-                .aggregate(models.Max('position'))['position__max']
-            self.position = self.position + 1 if self.position else 0
+            self.position = PositionQuerySet(
+                self.__class__).next_position()
 
         super(PositionRootMixin, self).save(*args, **kwargs)
 
 
+class PositionRelatedQuerySet(models.QuerySet):
+
+    def max_positions(self, groups):
+        """Max position by related field value, with single GROUP BY query,
+        same as in save, objects without related value placed after all"""
+
+        field = self.model._meta.get_field(
+            self.model.POSITION_RELATED_FIELD).attname
+
+        queryset = self.order_by()
+        if None not in groups:
+            queryset = queryset.filter(
+                **{'{}__in'.format(field): list(groups)})
+
+        positions = dict(
+            queryset.values_list(field).annotate(models.Max('position')))
+        if None in groups:
+            positions[None] = max(
+                [position for position in positions.values()
+                 if position is not None] or [None])
+        return positions
+
+    def bulk_create_positioned(self, objs, batch_size=None):
+        """Bulk create objects with position -1 placed after last item
+        of their related group, in order of objs"""
+
+        objs = list(objs)
+        field = self.model._meta.get_field(
+            self.model.POSITION_RELATED_FIELD).attname
+
+        pending = [obj for obj in objs if obj.position == -1]
+        if pending:
+            positions = self.max_positions(
+                set(getattr(obj, field) for obj in pending))
+
+            for obj in pending:
+                group = getattr(obj, field)
+                last = positions.get(group, None)
+                obj.position = positions[group] = \
+                    0 if last is None else last + 1
+
+        return self.bulk_create(objs, batch_size=batch_size)
+
+
 class PositionRelatedMixin(models.Model):
     POSITION_RELATED_FIELD = None
 
     position = models.BigIntegerField(
         _('position'), null=True, blank=True, default=-1)
 
+    objects = models.Manager.from_queryset(PositionRelatedQuerySet)()
+
     class Meta:
         abstract = True
 
@@ -125,7 +441,8 @@ class PositionRelatedMixin(models.Model):
                     self.POSITION_RELATED_FIELD: related_field})
             self.position = self.position.aggregate(
                 models.Max('position'))['position__max']
-            self.position = self.position + 1 if self.position else 0
+            self.position = self.position + 1 \
+                if self.position is not None else 0
 
         super(PositionRelatedMixin, self).save(*args, **kwargs)
 
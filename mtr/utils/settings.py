@@ -12,7 +12,14 @@ def getattr_with_prefix(prefix, name, default):
 
     prefix = getattr(settings, '{}_SETTINGS_PREFIX'.format(prefix), prefix)
 
-    default.update(getattr(settings, '{}_{}'.format(prefix, name), {}))
+    # nested dicts are merged, so partial sections keep other defaults
+    for key, value in getattr(
+            settings, '{}_{}'.format(prefix, name), {}).items():
+        if isinstance(value, dict) and isinstance(default.get(key), dict):
+            merged = dict(default[key])
+            merged.update(value)
+            value = merged
+        default[key] = value
 
     return default
 
@@ -23,6 +30,9 @@ SETTINGS = getattr_with_prefix('UTILS', 'SETTINGS', {
         'apps': [],
         'default_apps': True,
     },
+    'manager': {
+        'manifest_dir': None,
+    },
     'gettext': {
         'format': '{}:{}',
     },
@@ -30,7 +40,24 @@ SETTINGS = getattr_with_prefix('UTILS', 'SETTINGS', {
         'base_dir': 'themes',
         'theme': 'default',
         'use_in_render': True,
-        'fallback_to_default': True
+        'fallback_to_default': True,
+        'default_theme': 'default',
+        'version_subdirectory': False,
+        'cache': not getattr(settings, 'DEBUG', False),
+        'preload': [],
+    },
+    'render_cache': {
+        'alias': 'default',
+        'prefix': 'mtr.utils.render_to',
+        'timeout': 300,
+        'vary': ['language'],
+        'anonymous_only': True,
+    },
+    'published': {
+        'quantize': 60,
+        'cache_alias': 'default',
+        'timeout': 300,
+        'prefix': 'mtr.utils.published',
     },
 })
 
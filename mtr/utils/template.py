@@ -7,4 +7,4 @@ class ContextManager(BaseManager):
 
 
 manager = ContextManager()
-manager.import_modules(SETTINGS['template']['apps'])
+manager.import_modules(SETTINGS['template']['apps'], lazy=True)
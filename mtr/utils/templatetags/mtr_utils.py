@@ -5,7 +5,8 @@ from django.conf import settings
 from django.utils.formats import get_format
 from django.utils.translation import get_language
 
-from ..helpers import chunks as chunks_helper, in_group_plain
+from ..helpers import chunks as chunks_helper, \
+    in_groups as in_groups_helper
 
 register = template.Library()
 
@@ -71,14 +72,30 @@ def get(item, key):
 
 @register.filter
 def in_group(user, group):
-    return in_group_plain(user, group)
+    return in_groups_helper(user, group)
+
+
+@register.filter
+def in_groups(user, groups):
+    """Check if user in any of comma separated groups"""
+
+    return in_groups_helper(user, [
+        group.strip() for group in groups.split(',')])
+
+
+@register.filter
+def in_all_groups(user, groups):
+    """Check if user in all of comma separated groups"""
+
+    return in_groups_helper(user, [
+        group.strip() for group in groups.split(',')], require_all=True)
 
 
 @register.filter
 def chunks(l, m):
     if l is None:
         return l
-    return chunks_helper(l, m)
+    return chunks_helper(l, m, as_list=True)
 
 
 @register.filter
@@ -87,4 +104,4 @@ def chunks_by(l, m):
         return l
     if len(l) < 6:
         return [l]
-    return chunks_helper(l, math.ceil(len(l) / m))
+    return chunks_helper(l, math.ceil(len(l) / float(m)), as_list=True)
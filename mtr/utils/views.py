@@ -1,16 +1,12 @@
 from django.http import HttpResponse, JsonResponse
 from django.contrib.admin.views.decorators import staff_member_required
 
-from mtr.utils.helpers import models_list, model_app_name
+from mtr.utils.helpers import model_by_name
 
 
 @staff_member_required
 def model_label(request, name, pk):
-    fmodel = None
-    for model in models_list():
-        if name == model_app_name(model):
-            fmodel = model
-            break
+    fmodel = model_by_name(name)
 
     result = ''
 
@@ -26,11 +22,7 @@ def model_label(request, name, pk):
 
 @staff_member_required
 def model_resource(request, name):
-    fmodel = None
-    for model in models_list():
-        if name == model_app_name(model):
-            fmodel = model
-            break
+    fmodel = model_by_name(name)
 
     result = []
     query = request.GET.get('query', '')
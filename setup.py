@@ -34,5 +34,7 @@ setup(
         'Programming Language :: Python :: 3.5',
     ],
     keywords=('django', 'helpers', 'mixins', 'shortcuts'),
-    install_requires=('python-slugify', 'django-mptt==0.8.2'),
+    install_requires=(
+        'python-slugify', 'django-mptt==0.8.2',
+        'futures; python_version < "3"'),
 )
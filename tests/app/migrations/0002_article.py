@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 13:07
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Article',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('published_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='mtr.utils:published at')),
+                ('published_to', models.DateTimeField(blank=True, null=True, verbose_name='mtr.utils:published to')),
+                ('published', models.BooleanField(default=True, verbose_name='mtr.utils:published (available)')),
+                ('is_live', models.BooleanField(db_index=True, default=False, editable=False, verbose_name='mtr.utils:live')),
+                ('title', models.CharField(max_length=255, verbose_name='title')),
+            ],
+            options={
+                'verbose_name': 'article',
+                'verbose_name_plural': 'articles',
+                'ordering': ('-published_at', 'published'),
+                'abstract': False,
+            },
+        ),
+        migrations.AlterModelOptions(
+            name='office',
+            options={'ordering': ('-published_at', 'published'), 'verbose_name': 'office', 'verbose_name_plural': 'offices'},
+        ),
+        migrations.AlterIndexTogether(
+            name='office',
+            index_together=set([('published_at', 'published_to', 'published')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='article',
+            index_together=set([('published_at', 'published_to', 'published')]),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 13:09
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0003_step'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TagItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.BigIntegerField(blank=True, default=-1, null=True, verbose_name='mtr.utils:position')),
+                ('name', models.CharField(max_length=255, verbose_name='name')),
+                ('tag', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='app.Tag')),
+            ],
+            options={
+                'verbose_name': 'tag item',
+                'verbose_name_plural': 'tag items',
+                'ordering': ('position',),
+                'abstract': False,
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 13:16
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0004_tagitem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Note',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at_in_db', models.DateTimeField(auto_now_add=True, null=True, verbose_name='mtr.utils:created at')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='mtr.utils:created at')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='mtr.utils:updated at')),
+                ('text', models.CharField(max_length=255, verbose_name='text')),
+            ],
+            options={
+                'verbose_name': 'note',
+                'verbose_name_plural': 'notes',
+                'ordering': ('-created_at',),
+                'abstract': False,
+            },
+        ),
+    ]
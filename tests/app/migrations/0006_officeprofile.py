@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.9.13 on 2026-10-18 13:18
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('app', '0005_note'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OfficeProfile',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('description', models.CharField(max_length=255, verbose_name='description')),
+                ('office', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='profile', to='app.Office')),
+            ],
+            options={
+                'verbose_name': 'office profile',
+                'verbose_name_plural': 'office profiles',
+            },
+        ),
+    ]
@@ -9,7 +9,8 @@ from django.utils import six
 from django.utils.six.moves import range
 from django.db import models
 
-from mtr.utils.models.mixins import PublishedMixin
+from mtr.utils.models.mixins import PublishedMixin, LivePublishedMixin, \
+    PositionRootMixin, PositionRelatedMixin, TimeStampedMixin
 
 
 @python_2_unicode_compatible
@@ -25,6 +26,55 @@ class Office(PublishedMixin):
         verbose_name_plural = 'offices'
 
 
+@python_2_unicode_compatible
+class OfficeProfile(models.Model):
+    office = models.OneToOneField(Office, related_name='profile')
+    description = models.CharField('description', max_length=255)
+
+    def __str__(self):
+        return self.description
+
+    class Meta:
+        verbose_name = 'office profile'
+        verbose_name_plural = 'office profiles'
+
+
+@python_2_unicode_compatible
+class Article(LivePublishedMixin):
+    title = models.CharField('title', max_length=255)
+
+    def __str__(self):
+        return self.title
+
+    class Meta(LivePublishedMixin.Meta):
+        verbose_name = 'article'
+        verbose_name_plural = 'articles'
+
+
+@python_2_unicode_compatible
+class Step(PositionRootMixin):
+    name = models.CharField('name', max_length=255)
+
+    def __str__(self):
+        return self.name
+
+    class Meta(PositionRootMixin.Meta):
+        verbose_name = 'step'
+        verbose_name_plural = 'steps'
+
+
+@python_2_unicode_compatible
+class Note(TimeStampedMixin):
+    text = models.CharField('text', max_length=255)
+
+    def __str__(self):
+        return self.text
+
+    class Meta(TimeStampedMixin.Meta):
+        verbose_name = 'note'
+        verbose_name_plural = 'notes'
+
+
 @python_2_unicode_compatible
 class Tag(models.Model):
     name = models.CharField('tag', max_length=255)
@@ -37,6 +87,21 @@ class Tag(models.Model):
         verbose_name_plural = 'tags'
 
 
+@python_2_unicode_compatible
+class TagItem(PositionRelatedMixin):
+    POSITION_RELATED_FIELD = 'tag'
+
+    name = models.CharField('name', max_length=255)
+    tag = models.ForeignKey(Tag, null=True, blank=True)
+
+    def __str__(self):
+        return self.name
+
+    class Meta(PositionRelatedMixin.Meta):
+        verbose_name = 'tag item'
+        verbose_name_plural = 'tag items'
+
+
 @python_2_unicode_compatible
 class Person(models.Model):
     name = models.CharField('name', max_length=255)
@@ -0,0 +1,6 @@
+import sys
+
+# async syntax tests live in directory without __init__.py,
+# so test discovery skips them on python older than 3.5
+if sys.version_info >= (3, 5):
+    from .coroutines.manager import AsyncManagerTest  # noqa
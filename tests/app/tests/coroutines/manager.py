@@ -0,0 +1,59 @@
+import asyncio
+
+from unittest import TestCase
+
+from mtr.utils.manager import BaseManager
+
+
+class AsyncManagerTest(TestCase):
+
+    def setUp(self):
+        self.manager = BaseManager()
+        self.addCleanup(self.manager.shutdown)
+
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        asyncio.set_event_loop(self.loop)
+
+    def test_acall_all(self):
+        running = []
+
+        async def coroutine(data):
+            running.append(data)
+            await asyncio.sleep(0.01)
+            self.assertLessEqual(len(running), 2)
+            running.remove(data)
+            return data * 2
+
+        def sync(data):
+            return data * 3
+
+        self.manager.register('async', item=coroutine, name='first')
+        self.manager.register('async', item=coroutine, name='second')
+        self.manager.register('async', item=coroutine, name='third')
+        self.manager.register('async', item=sync)
+
+        results = self.loop.run_until_complete(
+            self.manager.acall_all('async', (2,), concurrency=2))
+
+        self.assertEqual(list(results.items()), [
+            ('first', 4), ('second', 4), ('third', 4), ('sync', 6)])
+
+    def test_cached_coroutine(self):
+        async def coroutine(data):
+            return data
+
+        with self.assertRaises(ValueError):
+            self.manager.register('async', item=coroutine, cache=True)
+
+        calls = []
+
+        def sync(data):
+            calls.append(data)
+            return data
+
+        self.manager.register('async', item=sync, cache=True)
+        for i in range(2):
+            self.loop.run_until_complete(
+                self.manager.acall_all('async', (2,)))
+        self.assertEqual(calls, [2])
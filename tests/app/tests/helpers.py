@@ -1,6 +1,27 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, RequestFactory, \
+    override_settings
+from django.utils import translation
+from django.contrib.auth.models import AnonymousUser, User, Group
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.utils.functional import SimpleLazyObject
+from django.contrib import messages
+from django.contrib.messages.storage.fallback import FallbackStorage
+from django.contrib.sessions.backends.cache import SessionStore
 
-from mtr.utils.helpers import absolute_url, relative_media_url
+from mtr.utils.helpers import absolute_url, relative_media_url, chunks, \
+    queryset_partitions, map_partitions, find_dublicates, dublicate_groups, \
+    delete_dublicates, merge_dublicates, merge_dicts, update_nested_dict, \
+    REPLACE, APPEND, model_by_name, models_list, clear_models_cache, \
+    model_choices, cached_model_choices, themed_templates, \
+    resolve_themed_template, clear_themed_templates, render_to, \
+    stream_template, invalidate_render_cache, user_group_names, in_groups, \
+    in_group_plain, clear_user_group_names, update_instance, \
+    update_instances, make_from_params_list, MethodWrapper
+
+from mtr.utils.settings import THEMES, getattr_with_prefix
+
+from ..models import Tag, Office, Person, Note, OfficeProfile
 
 
 class HelpersTest(TestCase):
@@ -13,3 +34,545 @@ class HelpersTest(TestCase):
         self.assertEqual(
             '/media/test/somemedia.jpeg',
             relative_media_url('test/somemedia.jpeg'))
+
+    def test_chunks_sequence_and_iterable(self):
+        self.assertEqual(
+            chunks([1, 2, 3, 4, 5], 2, as_list=True), [[1, 2], [3, 4], [5]])
+        self.assertEqual(list(chunks('abcde', 3)), ['abc', 'de'])
+        self.assertEqual(
+            list(chunks((i for i in range(5)), 2)), [[0, 1], [2, 3], [4]])
+
+    def test_chunks_queryset_by_primary_key(self):
+        tags = [Tag.objects.create(name='tag{}'.format(i)) for i in range(5)]
+
+        with self.assertNumQueries(3):
+            self.assertEqual(
+                chunks(Tag.objects.all(), 2, as_list=True),
+                [tags[:2], tags[2:4], tags[4:]])
+
+        tags.reverse()
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                chunks(Tag.objects.order_by('-name'), 2, as_list=True),
+                [tags[:2], tags[2:4], tags[4:]])
+
+
+def tag_names(queryset):
+    return [tag.name for tag in queryset]
+
+
+class PartitionsTest(TransactionTestCase):
+
+    def test_map_partitions_threads(self):
+        names = ['tag{}'.format(i) for i in range(10)]
+        for name in names:
+            Tag.objects.create(name=name)
+
+        partitions = queryset_partitions(Tag.objects.all(), 3)
+        self.assertEqual(len(partitions), 3)
+        self.assertEqual(sum(p.count() for p in partitions), 10)
+
+        progress = []
+        results = map_partitions(
+            Tag.objects.all(), tag_names, parts=3, executor='thread',
+            max_workers=2, progress=lambda *args: progress.append(args))
+
+        self.assertEqual(sum(results, []), names)
+        self.assertEqual(progress[-1], (3, 3))
+
+
+class DublicatesTest(TestCase):
+
+    def setUp(self):
+        self.offices = [
+            Office.objects.create(office=office, address=address)
+            for office, address in (
+                ('first', 'street'), ('first', 'street'),
+                ('first', 'avenue'), ('second', 'street'),
+                ('second', 'street'), ('second', 'street'))]
+        self.persons = [
+            Person.objects.create(
+                name='name', surname='surname', gender='M',
+                security_level=1, office=office)
+            for office in self.offices]
+
+    def test_find_dublicates_multiple_fields(self):
+        self.assertEqual(
+            set(find_dublicates(Office, ('office', 'address'))),
+            set([self.offices[1], self.offices[5]]))
+        self.assertEqual(
+            set(find_dublicates(Office, 'office', keep='oldest')),
+            set([self.offices[0], self.offices[3]]))
+
+        groups = list(dublicate_groups(Office, 'office', batch_size=1))
+        self.assertEqual(len(groups), 2)
+        self.assertEqual(groups[0][0]['count_id'], 3)
+
+    def test_delete_dublicates(self):
+        self.assertEqual(
+            delete_dublicates(Office, ('office', 'address'), batch_size=1), 3)
+        self.assertEqual(
+            set(Office.objects.all()),
+            set([self.offices[1], self.offices[2], self.offices[5]]))
+
+    def test_merge_dublicates(self):
+        self.assertEqual(merge_dublicates(Office, ('office', 'address')), 3)
+        self.assertEqual(Office.objects.count(), 3)
+        self.assertEqual(Person.objects.count(), 6)
+        self.assertEqual(
+            [p.office_id for p in Person.objects.order_by('pk')], [
+                self.offices[1].pk, self.offices[1].pk,
+                self.offices[2].pk, self.offices[5].pk,
+                self.offices[5].pk, self.offices[5].pk])
+
+    def test_merge_dublicates_many_to_many(self):
+        tags = [Tag.objects.create(name=name)
+                for name in ('tag', 'tag', 'tag', 'other')]
+        self.persons[0].tags.add(tags[0], tags[3])
+        self.persons[1].tags.add(tags[1], tags[2])
+        self.persons[2].tags.add(tags[0], tags[1])
+
+        self.assertEqual(merge_dublicates(Tag, 'name'), 2)
+        self.assertEqual(
+            [list(person.tags.order_by('pk'))
+             for person in self.persons[:3]],
+            [[tags[2], tags[3]], [tags[2]], [tags[2]]])
+
+    def test_merge_dublicates_one_to_one(self):
+        for office in self.offices[3:]:
+            OfficeProfile.objects.create(
+                office=office, description=str(office.pk))
+
+        self.assertEqual(merge_dublicates(Office, ('office', 'address')), 3)
+        self.assertEqual(
+            list(OfficeProfile.objects.values_list('office', flat=True)),
+            [self.offices[5].pk])
+
+
+class MergeDictsTest(TestCase):
+
+    def test_merge_dicts_strategies(self):
+        base = {'a': {'b': 1, 'c': [1]}, 'd': {'e': 2}}
+        other = {'a': {'c': [2], 'f': {'g': 3}}, 'h': 4}
+
+        merged = merge_dicts(base, other, lists=APPEND, inplace=False)
+        self.assertEqual(merged, {
+            'a': {'b': 1, 'c': [1, 2], 'f': {'g': 3}}, 'd': {'e': 2}, 'h': 4})
+        self.assertEqual(base, {'a': {'b': 1, 'c': [1]}, 'd': {'e': 2}})
+        self.assertIs(merged['d'], base['d'])
+        self.assertIs(merged['a']['f'], other['a']['f'])
+
+        self.assertEqual(
+            merge_dicts(dict(base), other, strategy=REPLACE),
+            {'a': {'c': [2], 'f': {'g': 3}}, 'd': {'e': 2}, 'h': 4})
+
+        updated = update_nested_dict(base, other)
+        self.assertIs(updated, base)
+        self.assertEqual(base['a'], {'b': 1, 'c': [2], 'f': {'g': 3}})
+        self.assertIsNot(base['a']['f'], other['a']['f'])
+
+
+class ModelsRegistryTest(TestCase):
+
+    def tearDown(self):
+        if 'Settings' in Tag.__dict__:
+            del Tag.Settings
+        clear_models_cache()
+
+    def test_model_by_name(self):
+        self.assertIsNone(model_by_name('app.tag'))
+
+        class Settings:
+            sync = {'ignore': True}
+
+        Tag.Settings = Settings
+        self.assertIsNone(model_by_name('app.tag'))
+
+        clear_models_cache()
+        self.assertEqual(model_by_name('app.tag'), Tag)
+        self.assertEqual(list(models_list()), [Tag])
+
+    def test_cached_model_choices(self):
+        class Settings:
+            sync = {'ignore': True}
+
+        Tag.Settings = Settings
+        clear_models_cache()
+
+        choices = cached_model_choices()
+        self.assertEqual(choices, tuple(model_choices()))
+        self.assertIs(cached_model_choices(False), cached_model_choices(False))
+
+        with translation.override('de'):
+            self.assertEqual(cached_model_choices(False), choices[1:])
+
+        with translation.override(None):
+            self.assertEqual(cached_model_choices(False), choices[1:])
+
+        clear_models_cache()
+        self.assertIsNot(cached_model_choices(False), choices[1:])
+
+
+class ThemedTemplatesTest(TestCase):
+
+    def setUp(self):
+        self.cache = THEMES['cache']
+        THEMES['cache'] = True
+
+    def tearDown(self):
+        THEMES['cache'] = self.cache
+        clear_themed_templates()
+
+    def test_themed_templates(self):
+        self.assertEqual(
+            themed_templates('themed.html'),
+            ['themes/default/themed.html', 'themed.html'])
+        self.assertEqual(
+            themed_templates('themed.html', version_subdirectory=True)[1:],
+            ['themes/default/themed.html', 'themed.html'])
+
+    def test_resolve_themed_template(self):
+        template = resolve_themed_template('themed.html')
+        self.assertEqual(
+            template.origin.template_name, 'themes/default/themed.html')
+        self.assertIs(resolve_themed_template('themed.html'), template)
+
+        template = resolve_themed_template('admin/base.html')
+        self.assertEqual(template.origin.template_name, 'admin/base.html')
+
+    def test_render_to(self):
+        @render_to('themed.html')
+        def view(request):
+            return {'result': 'value'}
+
+        request = RequestFactory().get('/')
+        self.assertEqual(view(request).content.strip(), b'themed value')
+        self.assertEqual(view(request).content.strip(), b'themed value')
+
+    def test_stream_template(self):
+        template = resolve_themed_template('stream.html')
+        context = {'items': range(3)}
+        request = RequestFactory().get('/')
+
+        chunks = list(stream_template(template, context, request, 1))
+        self.assertTrue(len(chunks) > 1)
+        self.assertEqual(''.join(chunks), template.render(context, request))
+        self.assertIn(' child', chunks)
+
+    def test_stream_template_loop_in_block(self):
+        template = resolve_themed_template('stream.html')
+        context = {'items': range(1000)}
+        request = RequestFactory().get('/')
+
+        chunks = stream_template(template, context, request, 100)
+        first = next(chunks)
+        self.assertTrue(first.startswith('<h1>base child</h1>'))
+        self.assertTrue(len(first) < 200)
+
+        rest = list(chunks)
+        self.assertTrue(len(rest) > 10)
+        self.assertEqual(
+            first + ''.join(rest), template.render(context, request))
+
+    def test_render_to_render_kwargs(self):
+        @render_to('themed.html', dirs=[], content_type='text/plain')
+        def view(request):
+            return {'result': 'value'}
+
+        response = view(RequestFactory().get('/'))
+        self.assertEqual(response.content.strip(), b'themed value')
+        self.assertEqual(response['Content-Type'], 'text/plain')
+
+    def test_render_to_stream(self):
+        @render_to('stream.html', stream=True)
+        def view(request):
+            return {'items': ['a', 'b']}
+
+        response = view(RequestFactory().get('/'))
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            b''.join(response.streaming_content).strip(),
+            b'<h1>base child</h1>\n<p>a</p><p>b</p>')
+
+
+class RenderCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.calls = []
+
+        @render_to('themed.html', cache=60)
+        def view(request, pk):
+            self.calls.append(pk)
+            return {'result': pk}
+
+        self.view = view
+
+    def request(self, path='/', user=None):
+        request = RequestFactory().get(path)
+        request.user = user or AnonymousUser()
+        return request
+
+    def test_cached(self):
+        response = self.view(self.request(), 1)
+        self.assertEqual(
+            self.view(self.request(), 1).content, response.content)
+        self.assertEqual(self.calls, [1])
+
+        self.view(self.request(), 2)
+        self.view(self.request('/?page=2'), 1)
+        with translation.override('de'):
+            self.view(self.request(), 1)
+        self.assertEqual(self.calls, [1, 2, 1, 1])
+
+    def test_invalidate(self):
+        self.view(self.request(), 1)
+        invalidate_render_cache('themed.html')
+        self.view(self.request(), 1)
+        self.assertEqual(self.calls, [1, 1])
+
+    def test_not_cached_personal(self):
+        @render_to('csrf.html', cache=60)
+        def view(request):
+            self.calls.append(1)
+            return {'result': 'form'}
+
+        first = view(self.request())
+        second = view(self.request())
+        self.assertEqual(self.calls, [1, 1])
+        self.assertIn(b'csrfmiddlewaretoken', first.content)
+        self.assertNotEqual(first.content, second.content)
+
+        @render_to('themed.html', cache=60)
+        def cookie_view(request):
+            self.calls.append(2)
+            response = HttpResponse()
+            response.set_cookie('name', 'value')
+            return response
+
+        cookie_view(self.request())
+        cookie_view(self.request())
+        self.assertEqual(self.calls, [1, 1, 2, 2])
+
+    def test_not_cached_session(self):
+        @render_to('themed.html', cache=60)
+        def view(request):
+            return {'result': request.session.get('cart')}
+
+        contents = []
+        for cart in ('alice-cart', 'bob-cart'):
+            request = self.request()
+            request.session = SessionStore()
+            request.session['cart'] = cart
+            request.session.accessed = False
+            contents.append(view(request).content.strip())
+            self.assertTrue(request.session.accessed)
+        self.assertEqual(
+            contents, [b'themed alice-cart', b'themed bob-cart'])
+
+        request = self.request()
+        request.session = SessionStore()
+        request.session.accessed = True
+        self.view(request, 1)
+        self.view(request, 1)
+        self.assertEqual(self.calls, [1])
+
+    def test_not_cached_messages(self):
+        @render_to('messages.html', cache=60)
+        def view(request):
+            self.calls.append(1)
+            return {'result': 'page'}
+
+        @render_to('themed.html', cache=60)
+        def add_view(request):
+            self.calls.append(2)
+            messages.info(request, 'added')
+            return {'result': 'page'}
+
+        def request():
+            request = self.request()
+            request.session = SessionStore()
+            request._messages = FallbackStorage(request)
+            return request
+
+        first = request()
+        messages.info(first, 'alice')
+        self.assertIn(b'alice', view(first).content)
+        self.assertNotIn(b'alice', view(request()).content)
+        self.assertEqual(self.calls, [1, 1])
+
+        add_view(request())
+        add_view(request())
+        self.assertEqual(self.calls, [1, 1, 2, 2])
+
+    def test_anonymous_only(self):
+        user = User(username='user')
+        self.view(self.request(user=user), 1)
+        self.view(self.request(user=user), 1)
+        self.assertEqual(self.calls, [1, 1])
+
+
+class UserGroupsTest(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create(username='user')
+        self.user.groups.add(
+            Group.objects.create(name='editors'),
+            Group.objects.create(name='managers'))
+        Group.objects.create(name='admins')
+
+    def test_user_group_names(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(
+                user_group_names(self.user),
+                frozenset(['editors', 'managers']))
+            self.assertTrue(in_group_plain(self.user, 'editors'))
+            self.assertFalse(in_group_plain(self.user, 'admins'))
+            self.assertTrue(in_groups(self.user, ['admins', 'editors']))
+            self.assertFalse(in_groups(
+                self.user, ['admins', 'editors'], require_all=True))
+            self.assertTrue(in_groups(
+                self.user, ['managers', 'editors'], require_all=True))
+
+        clear_user_group_names(self.user)
+        user = User.objects.prefetch_related('groups').get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(in_group_plain(user, 'managers'))
+
+        self.assertEqual(user_group_names(AnonymousUser()), frozenset())
+
+    def test_clear_user_group_names_lazy_user(self):
+        user = SimpleLazyObject(lambda: User.objects.get(pk=self.user.pk))
+        self.assertIn('editors', user_group_names(user))
+
+        clear_user_group_names(user)
+        clear_user_group_names(user)
+        self.user.groups.clear()
+        self.assertEqual(user_group_names(user), frozenset())
+
+
+class UpdateInstancesTest(TestCase):
+
+    def setUp(self):
+        self.tags = [Tag.objects.create(name='tag') for i in range(3)]
+        self.office = Office.objects.create(office='office', address='a')
+
+    def test_update_instance(self):
+        tag = self.tags[0]
+        with self.assertNumQueries(0):
+            update_instance(tag, {'name': 'tag'})
+
+        with self.assertNumQueries(1):
+            update_instance(tag, {'name': 'new'})
+        self.assertEqual(Tag.objects.get(pk=tag.pk).name, 'new')
+
+        person = Person(
+            name='name', surname='surname', gender='man',
+            security_level=1, office=self.office)
+        update_instance(person, {'name': 'other'})
+        self.assertIsNotNone(person.pk)
+
+        with self.assertNumQueries(0):
+            update_instance(person, {'office': self.office})
+        with self.assertNumQueries(1):
+            update_instance(person, {'office_id': None})
+
+    def test_update_instance_auto_now(self):
+        note = Note.objects.create(text='text')
+        updated_at = note.updated_at
+
+        update_instance(note, {'text': 'text'})
+        self.assertEqual(
+            Note.objects.get(pk=note.pk).updated_at, updated_at)
+
+        update_instance(note, {'text': 'new'})
+        self.assertGreater(
+            Note.objects.get(pk=note.pk).updated_at, updated_at)
+
+        self.assertEqual(
+            update_instances(Note.objects.all(), {'text': 'other'}), 1)
+        self.assertGreater(
+            Note.objects.get(pk=note.pk).updated_at, note.updated_at)
+
+    def test_update_instances(self):
+        self.assertEqual(
+            update_instances(Tag.objects.all(), {'name': 'tag'}), 0)
+        self.assertEqual(
+            update_instances(Tag.objects.filter(
+                pk__in=[tag.pk for tag in self.tags[:2]]), {'name': 'new'}), 2)
+
+        tags = list(Tag.objects.order_by('pk'))
+        with self.assertNumQueries(3):
+            self.assertEqual(update_instances(
+                tags, lambda tag: {'name': 'new'}), 1)
+        self.assertEqual(
+            set(Tag.objects.values_list('name', flat=True)), set(['new']))
+
+        with self.assertNumQueries(4):
+            self.assertEqual(update_instances(
+                tags, lambda tag: {'name': str(tag.pk % 2)}), 3)
+        self.assertEqual(
+            set(Tag.objects.values_list('name', flat=True)), set(['0', '1']))
+
+
+class MakeFromParamsTest(TestCase):
+
+    def test_make_from_params_list(self):
+        tags = [Tag.objects.create(name='tag') for i in range(2)]
+
+        with self.assertNumQueries(2):
+            instances = make_from_params_list(Tag, [
+                {'id': tags[0].pk}, {'id': str(tags[1].pk), 'name': 'new'},
+                {'name': 'created'}, {'id': None, 'name': 'created'},
+            ], create=True)
+
+        self.assertEqual(instances[:2], tags)
+        self.assertEqual(instances[1].name, 'new')
+        self.assertEqual(
+            Tag.objects.filter(name='created').count(), 2)
+
+        with self.assertRaises(Tag.DoesNotExist):
+            make_from_params_list(Tag, [{'id': 10 ** 6}, {'id': tags[0].pk}])
+
+
+class MethodWrapperTest(TestCase):
+
+    def test_method_wrapper(self):
+        bind = [('get_{}_display', ['gender'])]
+        person = Person(gender='man')
+        wrapper = MethodWrapper(person, bind)
+
+        self.assertEqual(wrapper.gender(), person.get_gender_display())
+        self.assertIs(wrapper.instance, person)
+        self.assertIsInstance(wrapper, MethodWrapper)
+        self.assertIs(type(MethodWrapper(Person(), bind)), type(wrapper))
+        self.assertFalse(hasattr(wrapper, '__dict__'))
+
+        self.assertIsInstance(MethodWrapper(person), MethodWrapper)
+
+    def test_method_wrapper_bind_in_subclass_init(self):
+        class PersonWrapper(MethodWrapper):
+            def __init__(self, instance):
+                super(PersonWrapper, self).__init__(
+                    instance, bind=[('get_{}_display', ['gender'])])
+
+        person = Person(gender='man')
+        wrapper = PersonWrapper(person)
+
+        self.assertEqual(wrapper.gender(), person.get_gender_display())
+        self.assertIsInstance(wrapper, PersonWrapper)
+        self.assertIs(type(PersonWrapper(Person())), type(wrapper))
+
+
+class SettingsTest(TestCase):
+
+    @override_settings(UTILS_SETTINGS={
+        'published': {'quantize': 300}, 'apps': ['app']})
+    def test_getattr_with_prefix_nested(self):
+        self.assertEqual(getattr_with_prefix('UTILS', 'SETTINGS', {
+            'published': {'quantize': 60, 'prefix': 'published'},
+            'apps': [],
+        }), {
+            'published': {'quantize': 300, 'prefix': 'published'},
+            'apps': ['app'],
+        })
@@ -1,6 +1,16 @@
+import os
+import json
+import time
+import shutil
+import tempfile
+import threading
+import multiprocessing
+
 from unittest import TestCase
+from concurrent.futures import TimeoutError
 
-from mtr.utils.manager import BaseManager
+from mtr.utils.manager import BaseManager, LazyHandler, DispatchError
+from mtr.utils.memoize import Memoized
 
 manager = BaseManager()
 
@@ -112,3 +122,309 @@ class ManagerTest(TestCase):
                     self.assertIn(value, (nested_one, nested_two))
             else:
                 self.assertIn(related, (not_related_one, not_related_two))
+
+    def test_register_position_order_and_freeze(self):
+        @self.manager.register('ordered', position=3)
+        def third(data):
+            return data
+
+        @self.manager.register('ordered', position=1)
+        def first(data):
+            return data
+
+        @self.manager.register('ordered', position=2)
+        def second(data):
+            return data
+
+        @self.manager.register('ordered', related='asd', position=2)
+        def related_second(data):
+            return data
+
+        @self.manager.register('ordered', related='asd', position=1)
+        def related_first(data):
+            return data
+
+        self.assertEqual(
+            [name for name, func in self.manager.items('ordered')],
+            ['first', 'second', 'third'])
+        self.assertEqual(
+            [func for name, func in self.manager.items(
+                'ordered', related='asd')],
+            [related_first, related_second])
+
+        self.manager.freeze()
+
+        self.assertEqual(self.manager.get('ordered', 'second'), second)
+        self.assertEqual(
+            self.manager.get('ordered', 'related_first', related='asd'),
+            related_first)
+        self.assertEqual(self.manager.items('missing'), ())
+
+        with self.assertRaises(RuntimeError):
+            self.manager.register('ordered', item=lambda data: data)
+        with self.assertRaises(RuntimeError):
+            self.manager.unregister('ordered', 'first')
+
+    def test_register_lazy_path(self):
+        self.manager.register(
+            'lazy', item='app.tests.testmodule:handler', label='lazy')
+        self.manager.register(
+            'lazy', item='app.tests.testmodule.some_item_func', name='sum')
+
+        self.assertIsInstance(
+            self.manager._registered['lazy']['handler'], LazyHandler)
+
+        from .testmodule import handler, some_item_func
+
+        self.assertEqual(self.manager.get('lazy', 'handler'), handler)
+        self.assertEqual(handler.label, 'lazy')
+        self.assertEqual(self.manager.get('lazy', 'sum'), some_item_func)
+        self.assertEqual(
+            self.manager._registered['lazy']['sum'](1, 2), 3)
+
+    def test_import_modules_lazy(self):
+        self.manager.import_modules(
+            ('app.tests.testmodule:manager',), lazy=True)
+
+        self.assertFalse(self.manager._imported)
+        self.assertNotIn('request', self.manager._registered)
+
+        self.assertEqual(self.manager.get('request', 'handler')(4), 8)
+        self.assertTrue(self.manager._imported)
+        self.assertIsNone(self.manager._pending)
+
+    def test_update_lazy(self):
+        lazy = BaseManager()
+        lazy.import_modules(('app.tests.testmodule:manager',), lazy=True)
+
+        self.manager.update(lazy)
+        self.assertEqual(self.manager.get('request', 'handler')(4), 8)
+        self.assertEqual(list(lazy.all('request')), ['handler'])
+
+    def test_import_from_app_list_manifest(self):
+        from . import testmodule  # noqa
+
+        manifest_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, manifest_dir)
+
+        self.manager.import_from_app_list(
+            ['app.tests'], type_name='request', manifest_dir=manifest_dir)
+
+        self.assertEqual(self.manager.get('request', 'handler')(4), 8)
+        self.assertEqual(len(os.listdir(manifest_dir)), 1)
+
+        cached = BaseManager()
+        cached.import_from_app_list(
+            ['app.tests'], type_name='request', manifest_dir=manifest_dir)
+        self.assertEqual(cached.get('request', 'handler')(4), 8)
+        self.assertIn('request', cached.manifest())
+
+        missing = BaseManager()
+        missing.import_from_app_list(
+            ['app.tests'], type_name='missing', manifest_dir=manifest_dir)
+        self.assertEqual(missing._registered, {})
+
+    def test_import_from_app_list_manifest_skips_imports(self):
+        from mtr.utils import manager as manager_module
+
+        manifest_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, manifest_dir)
+
+        self.manager.import_from_app_list(
+            ['app.tests'], type_name='request', manifest_dir=manifest_dir)
+
+        imported = []
+        import_module = manager_module.importlib.import_module
+
+        def record(name, *args, **kwargs):
+            imported.append(name)
+            return import_module(name, *args, **kwargs)
+
+        manager_module.importlib.import_module = record
+        self.addCleanup(
+            setattr, manager_module.importlib, 'import_module',
+            import_module)
+
+        BaseManager().import_from_app_list(
+            ['app.tests'], type_name='missing', manifest_dir=manifest_dir)
+        self.assertNotIn('app.tests.manager', imported)
+
+    def test_import_from_app_list_untrusted_manifest(self):
+        manifest_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, manifest_dir)
+        modules = self.manager._app_modules(['app.tests'], 'manager')
+
+        def write(name, manifest):
+            path = self.manager._manifest_path(
+                modules, 'manager', name, manifest_dir)
+            with open(path, 'w') as f:
+                json.dump(manifest, f)
+            return path
+
+        write('manager', {'os': {'request': []}})
+        self.manager.import_from_app_list(
+            ['app.tests'], type_name='request', manifest_dir=manifest_dir)
+        self.assertEqual(self.manager.get('request', 'handler')(4), 8)
+
+        path = write(
+            'missing', {'app.tests.manager': {'request': [[None, 'a', 0]]}})
+        missing = BaseManager()
+        missing.import_from_app_list(
+            ['app.tests'], name='missing', manifest_dir=manifest_dir)
+        self.assertEqual(missing._registered, {})
+        with open(path) as f:
+            self.assertEqual(json.load(f), {})
+
+    def test_call_all_and_imap(self):
+        @self.manager.register('dispatch', position=2)
+        def slow(data):
+            time.sleep(0.05)
+            return data * 2
+
+        @self.manager.register('dispatch', position=1)
+        def fast(data):
+            return data * 3
+
+        self.addCleanup(self.manager.shutdown)
+
+        self.assertEqual(
+            list(self.manager.call_all('dispatch', (2,)).items()),
+            [('fast', 6), ('slow', 4)])
+        self.assertEqual(
+            list(self.manager.imap('dispatch', (2,), ordered=False)),
+            [('fast', 6), ('slow', 4)])
+        self.assertEqual(self.manager.call('dispatch', 'fast', (1,)), 3)
+
+    def test_call_all_errors_and_timeout(self):
+        @self.manager.register('dispatch')
+        def failing(data):
+            raise ValueError(data)
+
+        @self.manager.register('dispatch')
+        def hanging(data):
+            time.sleep(0.5)
+
+        @self.manager.register('dispatch')
+        def working(data):
+            return data
+
+        self.addCleanup(self.manager.shutdown)
+
+        with self.assertRaises(DispatchError) as context:
+            self.manager.call_all('dispatch', (1,), timeout={'hanging': 0.1})
+
+        self.assertEqual(list(context.exception.results.items()), [
+            ('working', 1)])
+        self.assertIsInstance(
+            context.exception.errors['failing'], ValueError)
+        self.assertIsInstance(
+            context.exception.errors['hanging'], TimeoutError)
+
+    def test_call_all_process_executor(self):
+        manager = BaseManager(executor='process', max_workers=2)
+        manager.register('request', item='app.tests.testmodule:handler')
+        self.addCleanup(manager.shutdown)
+
+        self.assertEqual(manager.call_all('request', (4,)), {'handler': 8})
+
+    def test_default_max_workers(self):
+        manager = BaseManager()
+        self.addCleanup(manager.shutdown)
+
+        self.assertEqual(
+            manager._get_executor()._max_workers,
+            multiprocessing.cpu_count() * 5)
+
+    def test_metrics(self):
+        @self.manager.register('metrics')
+        def working(data):
+            return data
+
+        @self.manager.register('metrics')
+        def failing(data):
+            raise ValueError(data)
+
+        self.addCleanup(self.manager.shutdown)
+
+        self.manager.call('metrics', 'working', (1,))
+        self.assertEqual(self.manager.metrics(), {})
+
+        self.manager.enable_metrics()
+        self.manager.call('metrics', 'working', (1,))
+        with self.assertRaises(DispatchError):
+            self.manager.call_all('metrics', (1,))
+
+        metrics = self.manager.metrics()
+        working_stats = metrics[('metrics', None, 'working')]
+        failing_stats = metrics[('metrics', None, 'failing')]
+
+        self.assertEqual(working_stats['calls'], 2)
+        self.assertEqual(working_stats['errors'], 0)
+        self.assertGreater(working_stats['p99'], 0)
+        self.assertEqual(failing_stats['calls'], 1)
+        self.assertEqual(failing_stats['errors'], 1)
+
+        self.manager.reset_metrics()
+        self.assertEqual(self.manager.metrics(), {})
+
+    def test_register_cache_and_invalidate(self):
+        calls = []
+
+        @self.manager.register('cached', cache={'maxsize': 2})
+        def label(data):
+            calls.append(data)
+            return 'label {}'.format(data)
+
+        @self.manager.register('cached', related='asd', cache=True)
+        def related_label(data):
+            calls.append(data)
+            return data
+
+        handler = self.manager.get('cached', 'label')
+        self.assertIsInstance(handler, Memoized)
+        self.assertEqual(handler.label, None)
+
+        self.assertEqual(handler(1), 'label 1')
+        self.assertEqual(handler(1), 'label 1')
+        self.assertEqual(calls, [1])
+
+        handler(2)
+        handler(3)
+        handler(1)
+        self.assertEqual(calls, [1, 2, 3, 1])
+        self.assertEqual(len(handler.cache), 2)
+
+        self.manager.get('cached', 'related_label', related='asd')(4)
+        self.manager.invalidate('cached')
+        self.assertEqual(len(handler.cache), 0)
+        self.manager.get('cached', 'related_label', related='asd')(4)
+        self.assertEqual(calls, [1, 2, 3, 1, 4, 4])
+
+    def test_copy_on_write_registry(self):
+        @self.manager.register('cow')
+        def first(data):
+            return data
+
+        registered = self.manager._registered
+        items = self.manager.items('cow')
+
+        @self.manager.register('cow')
+        def second(data):
+            return data
+
+        self.assertEqual(list(registered['cow'].keys()), ['first'])
+        self.assertEqual(items, (('first', first),))
+        self.assertEqual(len(self.manager.items('cow')), 2)
+
+        def register(index):
+            self.manager.register(
+                'cow', item=lambda data: data, name='thread{}'.format(index))
+
+        threads = [
+            threading.Thread(target=register, args=(i,)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(self.manager.items('cow')), 22)
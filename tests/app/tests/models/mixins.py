@@ -1,6 +1,14 @@
+from datetime import timedelta
+
 from django.test import TestCase
+from django.utils import timezone
+from django.core.cache import cache
+from django.core.management import call_command
+from django.utils.six import StringIO
+
+from mtr.utils.models.mixins import refresh_live_published, quantized_now
 
-from ...models import Office
+from ...models import Office, Article, Step, Tag, TagItem
 
 
 class PublishedMixinTest(TestCase):
@@ -28,3 +36,163 @@ class PublishedMixinTest(TestCase):
         self.assertQuerysetEqual(
             Office.published_objects.all(), reversed(published_offices),
             transform=lambda o: o)
+
+
+class LivePublishedMixinTest(TestCase):
+
+    def test_is_live(self):
+        now = timezone.now()
+        live = Article.objects.create(title='live')
+        expired = Article.objects.create(
+            title='expired', published_to=now + timedelta(hours=1))
+        scheduled = Article.objects.create(
+            title='scheduled', published_at=now + timedelta(hours=1))
+        hidden = Article.objects.create(title='hidden', published=False)
+
+        self.assertTrue(expired.is_published())
+        self.assertFalse(scheduled.is_published())
+        self.assertFalse(hidden.is_live)
+        self.assertEqual(
+            set(Article.published_objects.all()), set([live, expired]))
+
+        later = now + timedelta(hours=2)
+        self.assertEqual(
+            refresh_live_published([Article], now=later), {Article: (1, 1)})
+        self.assertEqual(
+            set(Article.objects.live()), set([live, scheduled]))
+        self.assertEqual(Article.objects.refresh_live(now=later), (0, 0))
+
+        hidden.published_at = now - timedelta(hours=1)
+        hidden.published = True
+        hidden.save(update_fields=['published', 'published_at'])
+        self.assertTrue(Article.objects.get(pk=hidden.pk).is_live)
+
+    def test_refresh_published_command(self):
+        Article.objects.create(title='live')
+        Article.objects.update(is_live=False)
+
+        out = StringIO()
+        call_command('refresh_published', 'app.Article', stdout=out)
+        self.assertIn(
+            'app.Article: 1 activated, 0 deactivated', out.getvalue())
+        self.assertEqual(Article.published_objects.count(), 1)
+
+
+class PublishedCacheTest(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_quantized_now(self):
+        start, end = quantized_now(60), quantized_now(60, up=True)
+        self.assertEqual((start.second, start.microsecond), (0, 0))
+        self.assertEqual((end.second, end.microsecond), (0, 0))
+        self.assertTrue(start <= timezone.now() <= end)
+
+    def test_published_not_quantized(self):
+        office = Office.objects.create(
+            office='office', address='address',
+            published_to=timezone.now() + timedelta(seconds=30))
+        self.assertEqual(list(Office.objects.published()), [office])
+        self.assertEqual(list(Office.published_objects.all()), [office])
+        self.assertEqual(
+            list(Office.objects.published(quantize=60 * 60 * 24)), [])
+
+    def test_cached(self):
+        office = Office.objects.create(
+            office='office', address='address',
+            published_at=timezone.now() - timedelta(hours=1))
+
+        with self.assertNumQueries(1):
+            self.assertEqual(Office.published_objects.cached(), [office])
+            self.assertEqual(Office.published_objects.cached(), [office])
+            self.assertEqual(
+                Office.objects.published(quantize=True).cached(), [office])
+        self.assertEqual(
+            Office.objects.published(quantize=True).cached(ids=True),
+            [office.pk])
+
+        office.published = False
+        office.save()
+        self.assertEqual(Office.published_objects.cached(), [])
+        self.assertEqual(
+            Office.objects.published(quantize=True).cached(ids=True), [])
+
+
+class PositionRootMixinTest(TestCase):
+
+    def setUp(self):
+        self.steps = [Step.objects.create(name=str(i)) for i in range(4)]
+
+    def names(self):
+        return [step.name for step in Step.objects.all()]
+
+    def test_gapped_positions(self):
+        self.assertEqual(
+            [step.position for step in self.steps], [0, 1024, 2048, 3072])
+
+    def test_move_to(self):
+        with self.assertNumQueries(2):
+            self.assertEqual(Step.objects.move_to(self.steps[3], 1), 512)
+        self.assertEqual(self.names(), ['0', '3', '1', '2'])
+
+        Step.objects.move_to(self.steps[0], 10)
+        self.assertEqual(self.names(), ['3', '1', '2', '0'])
+        Step.objects.move_to(self.steps[2], 0)
+        self.assertEqual(self.names(), ['2', '3', '1', '0'])
+
+        Step.objects.filter(pk=self.steps[1].pk).update(position=513)
+        Step.objects.move_to(self.steps[0], 2)
+        self.assertEqual(self.names(), ['2', '3', '0', '1'])
+        self.assertEqual(
+            list(Step.objects.values_list('position', flat=True)),
+            [0, 1024, 2048, 3072])
+
+    def test_move_to_never_negative(self):
+        Step.objects.filter(pk=self.steps[0].pk).update(position=-1024)
+        Step.objects.filter(pk=self.steps[1].pk).update(position=0)
+
+        for i in range(12):
+            Step.objects.move_to(self.steps[2], i % 2)
+            Step.objects.move_to(self.steps[3], 0)
+
+        positions = list(Step.objects.values_list('position', flat=True))
+        self.assertTrue(all(position >= 0 for position in positions))
+        self.assertEqual(len(set(positions)), 4)
+
+    def test_reorder(self):
+        ids = [step.pk for step in reversed(self.steps)]
+        self.assertEqual(Step.objects.reorder(ids, batch_size=3), 4)
+        self.assertEqual(self.names(), ['3', '2', '1', '0'])
+
+
+class PositionRelatedMixinTest(TestCase):
+
+    def test_save(self):
+        tag = Tag.objects.create(name='tag')
+        items = [TagItem.objects.create(name=str(i), tag=tag)
+                 for i in range(3)]
+        self.assertEqual([item.position for item in items], [0, 1, 2])
+
+    def test_bulk_create_positioned(self):
+        tags = [Tag.objects.create(name=str(i)) for i in range(2)]
+        TagItem.objects.create(name='first', tag=tags[0])
+
+        with self.assertNumQueries(2):
+            TagItem.objects.bulk_create_positioned([
+                TagItem(name='a', tag=tags[0]),
+                TagItem(name='b', tag=tags[1]),
+                TagItem(name='c', tag=tags[0]),
+                TagItem(name='d', tag=tags[1], position=10),
+                TagItem(name='e', tag=tags[1]),
+            ])
+
+        self.assertEqual(
+            list(tags[0].tagitem_set.values_list('name', 'position')),
+            [('first', 0), ('a', 1), ('c', 2)])
+        self.assertEqual(
+            list(tags[1].tagitem_set.values_list('name', 'position')),
+            [('b', 0), ('e', 1), ('d', 10)])
+
+        TagItem.objects.bulk_create_positioned([TagItem(name='f')])
+        self.assertEqual(TagItem.objects.get(name='f').position, 11)
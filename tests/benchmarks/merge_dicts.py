@@ -0,0 +1,73 @@
+"""Compare recursive update_nested_dict with iterative merge_dicts,
+run from tests directory: python benchmarks/merge_dicts.py"""
+
+import os
+import sys
+import copy
+import timeit
+import collections
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'app.settings')
+
+import django  # noqa
+
+django.setup()
+
+from mtr.utils.helpers import merge_dicts  # noqa
+
+try:
+    Mapping = collections.abc.Mapping
+except AttributeError:
+    Mapping = collections.Mapping
+
+
+def recursive_update_nested_dict(d, u):
+    """Previous recursive implementation"""
+
+    for k, v in u.items():
+        if isinstance(v, Mapping):
+            r = recursive_update_nested_dict(d.get(k, {}), v)
+            d[k] = r
+        else:
+            d[k] = u[k]
+    return d
+
+
+def deep(depth, value):
+    result = {'value': value}
+    for level in range(depth):
+        result = {'level{}'.format(level): result, 'value': value}
+    return result
+
+
+def wide(width, value):
+    return dict(
+        ('key{}'.format(i), {'value': value, 'inner': {'value': value}})
+        for i in range(width))
+
+
+def run(name, base, other, number=200):
+    print(name)
+
+    cases = (
+        ('recursive', recursive_update_nested_dict, True),
+        ('iterative', merge_dicts, True),
+        ('recursive copy', lambda d, u: recursive_update_nested_dict(
+            copy.deepcopy(d), u), False),
+        ('shared', lambda d, u: merge_dicts(d, u, inplace=False), False),
+    )
+
+    for label, func, inplace in cases:
+        bases = [
+            copy.deepcopy(base) if inplace else base for i in range(number)]
+        elapsed = timeit.timeit(
+            lambda: [func(b, other) for b in bases], number=1)
+        print('  {:<15} {:.3f} ms'.format(label, elapsed / number * 1000))
+
+
+if __name__ == '__main__':
+    run('deep (depth 200)', deep(200, 1), deep(200, 2))
+    run('wide (width 5000)', wide(5000, 1), wide(5000, 2), number=20)
+    run('wide partial (width 5000)', wide(5000, 1), {'key1': {'value': 2}})